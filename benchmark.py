@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from libs.entity_manager import EntityManager
+from libs.headless import HeadlessGame, generate_map, use_dummy_drivers
+from libs.mapformat import MAP_EXTENSION
+from libs.saver import MapSaver
+
+use_dummy_drivers()
+
+import pygame  # noqa: E402 (the drivers must be chosen before pygame starts)
+
+MAP_SIZES = [(64, 32), (256, 64), (1024, 128)]
+REGRESSION_TOLERANCE = 0.8
+
+
+def bench_ticks(game, ticks, entities):
+    """Step several players over the map, as fast as possible."""
+    map_width = max(tile["pos"][0] for tile in game.tilemap.tilemap) * game.tilemap.tile_size
+    rng = random.Random(0)
+    players = [game.player]
+    while len(players) < entities:
+        players.append(type(game.player)(game, (rng.random() * map_width, 0), (8, 15)))
+
+    start = time.perf_counter()
+    for tick in range(ticks):
+        movement = (1 if tick // 120 % 2 else -1, 0)
+        for player in players:
+            if player.collisions["down"] and rng.random() < 0.02:
+                player.velocity[1] = -3
+            player.update(game.tilemap, movement)
+
+    return ticks * len(players) / (time.perf_counter() - start)
+
+
+def bench_enemies(game, ticks, count):
+    """Step a batch of enemies walking around the map."""
+    tiles = [tile["pos"] for tile in game.tilemap.tilemap]
+    enemies = EntityManager(game, "enemy", seed=0)
+    rng = random.Random(0)
+    for _ in range(count):
+        pos = rng.choice(tiles)
+        enemies.spawn((pos[0] * game.tilemap.tile_size, (pos[1] - 2) * game.tilemap.tile_size))
+
+    start = time.perf_counter()
+    for _ in range(ticks):
+        enemies.update(game.tilemap)
+
+    return ticks * count / (time.perf_counter() - start)
+
+
+def bench_physics_queries(game, calls):
+    tilemap = game.tilemap
+    tiles = [tile["pos"] for tile in tilemap.tilemap]
+    rng = random.Random(0)
+    positions = []
+    for _ in range(1000):
+        pos = rng.choice(tiles)
+        positions.append([(pos[0] + rng.random()) * tilemap.tile_size,
+                          (pos[1] - rng.random()) * tilemap.tile_size])
+
+    start = time.perf_counter()
+    for call in range(calls):
+        tilemap.physics_rects_around(positions[call % len(positions)])
+
+    return calls / (time.perf_counter() - start)
+
+
+def bench_render(game, frames):
+    surface = pygame.Surface((320, 240))
+    tilemap = game.tilemap
+    width = max(tile["pos"][0] for tile in tilemap.tilemap) * tilemap.tile_size
+    height = max(tile["pos"][1] for tile in tilemap.tilemap) * tilemap.tile_size
+
+    start = time.perf_counter()
+    for frame in range(frames):
+        offset = (frame * 3 % max(1, width - 320), frame % max(1, height - 240))
+        surface.fill((0, 0, 0))
+        tilemap.render(surface, offset=offset)
+
+    return frames / (time.perf_counter() - start)
+
+
+def bench_saves(game, saves, patch):
+    """Save a binary map after each tile edit, until the file is written.
+
+    Args:
+        game (HeadlessGame): The game holding the map.
+        saves (int): The number of saves.
+        patch (bool): Rewrite only the edited chunks, else the whole map.
+
+    Returns:
+        float: The saves per second.
+    """
+    tilemap = game.tilemap
+    tiles = list(tilemap.tilemap)
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        saver = MapSaver(tilemap, os.path.join(directory, "map" + MAP_EXTENSION))
+        saver.save()
+        saver.wait()
+
+        start = time.perf_counter()
+        for _ in range(saves):
+            tilemap.set_tile(rng.choice(tiles))
+            if not patch:
+                # Forgetting the layout of the file forces a full save
+                saver.layout = None
+            saver.save()
+            saver.wait()
+        elapsed = time.perf_counter() - start
+        saver.shutdown()
+
+    return saves / elapsed
+
+
+def run_benchmarks(maps, ticks, entities, enemies, calls, frames, saves):
+    results = {}
+    for name, game in maps:
+        results[name] = {
+            "ticks_per_sec": bench_ticks(game, ticks, entities),
+            "enemy_ticks_per_sec": bench_enemies(game, ticks // 10, enemies),
+            "physics_queries_per_sec": bench_physics_queries(game, calls),
+            "render_fps": bench_render(game, frames),
+            "patch_saves_per_sec": bench_saves(game, saves, patch=True),
+            "full_saves_per_sec": bench_saves(game, saves, patch=False),
+        }
+        print(f"{name:>12}  {len(game.tilemap.tilemap):>8} tiles  "
+              f"{results[name]['ticks_per_sec']:>10.0f} ticks/s  "
+              f"{results[name]['enemy_ticks_per_sec']:>10.0f} enemy ticks/s  "
+              f"{results[name]['physics_queries_per_sec']:>10.0f} queries/s  "
+              f"{results[name]['render_fps']:>8.0f} fps  "
+              f"{results[name]['patch_saves_per_sec']:>6.0f} patch/{results[name]['full_saves_per_sec']:.0f} full saves/s")
+
+    return results
+
+
+def compare(results, baseline):
+    """Print the measures that dropped below the tolerance of a baseline.
+
+    Returns:
+        bool: True if no measure regressed.
+    """
+    ok = True
+    for name, measures in results.items():
+        for measure, value in measures.items():
+            reference = baseline.get(name, {}).get(measure)
+            if reference and value < reference * REGRESSION_TOLERANCE:
+                print(f"regression: {name} {measure} {value:.0f} < {reference:.0f}")
+                ok = False
+
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the physics and tilemap hot paths.")
+    parser.add_argument("maps", nargs="*", help="map files to benchmark, generated maps if empty")
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--entities", type=int, default=16)
+    parser.add_argument("--enemies", type=int, default=256)
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--saves", type=int, default=20)
+    parser.add_argument("--save", help="write the results to a JSON file")
+    parser.add_argument("--baseline", help="compare the results to a saved JSON file")
+    args = parser.parse_args()
+
+    pygame.init()
+    if args.maps:
+        maps = [(path, HeadlessGame(map_path=path)) for path in args.maps]
+    else:
+        maps = []
+        for width, height in MAP_SIZES:
+            game = HeadlessGame(map_data=generate_map(width, height))
+            game.tilemap.autotile()
+            maps.append((f"{width}x{height}", game))
+
+    results = run_benchmarks(maps, args.ticks, args.entities, args.enemies, args.calls, args.frames, args.saves)
+
+    if args.save:
+        with open(args.save, "w") as file_content:
+            json.dump(results, file_content, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r") as file_content:
+            if not compare(results, json.load(file_content)):
+                raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from libs.levels import COMPILED_DIR, LEVELS_DIR
+from libs.mapformat import MAP_EXTENSION, encode_map
+from libs.tilemap import Tilemap
+from libs.utils import ASSETS_IMAGE, atomic_write
+
+TILES_DIR = ASSETS_IMAGE + "tiles/"
+PHASES = ["load", "validate", "collision", "encode", "write"]
+
+
+def tile_catalog(directory=TILES_DIR):
+    """Count the variants of each tile type, from the folders of the tile images.
+
+    Returns:
+        dict: The number of variants by tile type.
+    """
+    return {name: len([image for image in os.listdir(os.path.join(directory, name)) if image.endswith(".png")])
+            for name in sorted(os.listdir(directory)) if os.path.isdir(os.path.join(directory, name))}
+
+
+def validate(tilemap, catalog):
+    """List the tiles whose type or variant has no image.
+
+    Returns:
+        list: One message per invalid tile.
+    """
+    errors = []
+    tiles = [(tile, "tile") for tile in tilemap.tilemap]
+    tiles += [(tile, "off-grid tile") for tile in tilemap.offgrid_tiles.values()]
+    for tile, kind in tiles:
+        if tile["type"] not in catalog:
+            errors.append(f"{kind} at {tile['pos']}: unknown type {tile['type']!r}")
+        elif not 0 <= tile["variant"] < catalog[tile["type"]]:
+            errors.append(f"{kind} at {tile['pos']}: {tile['type']} has no variant {tile['variant']}")
+
+    return errors
+
+
+def compile_map(source, destination, catalog):
+    """Compile a JSON map into a binary map.
+
+    The tiles keep the variants of the source, autotiling is left to the
+    editor, so a compiled map looks the same as its JSON map. Runs in a
+    worker process, it only gets and returns plain data.
+
+    Returns:
+        dict: The report of the map: its sizes, errors and the time of each phase.
+    """
+    timings = {}
+    start = time.perf_counter()
+
+    def phase(name):
+        nonlocal start
+        now = time.perf_counter()
+        timings[name] = (now - start) * 1000
+        start = now
+
+    tilemap = Tilemap(None)
+    tilemap.load(source)
+    phase("load")
+
+    errors = validate(tilemap, catalog)
+    phase("validate")
+    report = {"source": source, "destination": destination, "errors": errors, "timings": timings,
+              "tiles": len(tilemap.tilemap), "chunks": len(tilemap.tilemap.chunks),
+              "offgrid": len(tilemap.offgrid_tiles), "rects": 0}
+    if errors:
+        return report
+
+    # Stored in the map, the game unpacks them instead of merging the cells again
+    collision = tilemap.collision.export()
+    report["rects"] = sum(len(rects) for _, _, rects in collision)
+    phase("collision")
+
+    data = encode_map([tilemap.tilemap.chunks[position] for position in sorted(tilemap.tilemap.chunks)],
+                      tilemap.tile_size, list(tilemap.offgrid_tiles.values()), collision)
+    phase("encode")
+
+    atomic_write(destination, data)
+    phase("write")
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile JSON maps into binary maps, in parallel.")
+    parser.add_argument("maps", nargs="*", help="JSON maps, map.json and the levels of assets/maps by default")
+    parser.add_argument("--output-dir", default=COMPILED_DIR, help="where to write the compiled maps")
+    parser.add_argument("--jobs", type=int, help="number of worker processes, one per CPU by default")
+    args = parser.parse_args()
+
+    sources = args.maps or [path for path in ["map.json"] if os.path.exists(path)] \
+        + sorted(glob.glob(os.path.join(LEVELS_DIR, "*.json")))
+    os.makedirs(args.output_dir, exist_ok=True)
+    catalog = tile_catalog()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(
+            compile_map, source,
+            os.path.join(args.output_dir, os.path.splitext(os.path.basename(source))[0] + MAP_EXTENSION),
+            catalog) for source in sources]
+        reports = [future.result() for future in futures]
+    duration = time.perf_counter() - start
+
+    print(f"{'map':<24}{'tiles':>8}{'chunks':>8}{'rects':>8}" + "".join(f"{name:>11}" for name in PHASES))
+    failed = False
+    for report in reports:
+        print(f"{report['source']:<24}{report['tiles']:>8}{report['chunks']:>8}{report['rects']:>8}"
+              + "".join(f"{report['timings'].get(name, 0):>9.1f}ms" for name in PHASES))
+        for error in report["errors"]:
+            print(f"  error: {error}")
+        failed = failed or bool(report["errors"])
+    print(f"{len(reports)} maps in {duration * 1000:.0f} ms")
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
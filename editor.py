@@ -1,40 +1,49 @@
 import sys
 import pygame
 
-from libs.clouds import Clouds
-from libs.entities import Player
+from libs.assets import AssetManager
+from libs.history import History
+from libs.presenter import Presenter
+from libs.saver import MapSaver
 from libs.tilemap import Tilemap
-from libs.utils import Animation, load_image, load_images
 
-RENDER_SCALE = 2.0
+DISPLAY_SIZE = (320, 240)
+WINDOW_SIZE = (640, 480)
+MAP_PATH = "map.json"  # a .map file is saved in the binary format
+AUTOSAVE_INTERVAL = 0  # seconds between two saves of the changes, 0 disables them
 
 
 class Editor:
     def __init__(self):
         pygame.init()
 
-        pygame.display.set_caption("Level editor")
-        self.screen = pygame.display.set_mode((640, 480))
-        self.display = pygame.Surface((320, 240))
+        self.presenter = Presenter("Level editor", DISPLAY_SIZE, WINDOW_SIZE)
+        self.display = self.presenter.display
 
         self.clock = pygame.time.Clock()
 
+        self.asset_manager = AssetManager()
         self.assets = {
-            "decor": load_images("tiles/decor"),
-            "grass": load_images("tiles/grass"),
-            "large_decor": load_images("tiles/large_decor"),
-            "stone": load_images("tiles/stone"),
+            "decor": self.asset_manager.load_images("tiles/decor"),
+            "grass": self.asset_manager.load_images("tiles/grass"),
+            "large_decor": self.asset_manager.load_images("tiles/large_decor"),
+            "stone": self.asset_manager.load_images("tiles/stone"),
+            "spawners": self.asset_manager.load_images("tiles/spawners"),
         }
+        self.background = self.asset_manager.load_image("background.png")
 
         self.movement = [False, False, False, False]
 
         self.tilemap = Tilemap(self, tile_size=16)
 
         try:
-            self.tilemap.load("map.json")
+            self.tilemap.load(MAP_PATH)
         except FileNotFoundError:
             pass
 
+        self.history = History(self.tilemap)
+        self.saver = MapSaver(self.tilemap, MAP_PATH, autosave=AUTOSAVE_INTERVAL)
+
         self.scroll = [0, 0]
 
         self.tile_list = list(self.assets)
@@ -44,74 +53,199 @@ class Editor:
         self.clicking = False
         self.right_clicking = False
         self.shift = False
+        self.ctrl = False
         self.on_grid = True
+        self.autotile = False
+
+        self.current_tile = None
+        self.current_tile_image = None
+        self.frame_state = None
+        self.cursor_rect = None
+
+        # Selected cells, as (left, top, right, bottom), inclusive
+        self.selecting = False
+        self.selection_start = None
+        self.selection = None
+        self.clipboard = []
+
+    def tile_image(self):
+        """Get the transparent preview of the selected tile, made once per selection."""
+        current_tile = (self.tile_list[self.tile_group], self.tile_variant)
+        if current_tile != self.current_tile:
+            self.current_tile = current_tile
+            self.current_tile_image = self.assets[current_tile[0]][current_tile[1]].copy()
+            self.current_tile_image.set_alpha(100)
+
+        return self.current_tile_image
+
+    def current_state(self):
+        return self.tile_list[self.tile_group], self.tile_variant
+
+    def cell_state(self, x, y):
+        tile = self.tilemap.tilemap.get(x, y)
+        return None if tile is None else (tile["type"], tile["variant"])
+
+    def autotile_area(self, left, top, right, bottom):
+        """Autotile the cells of an area, recording the changes in the current edit."""
+        if not self.autotile:
+            return
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                self.history.touch(x, y)
+                self.tilemap.autotile_cell(x, y)
+
+    def paint(self, x, y):
+        state = self.cell_state(x, y)
+        # Autotiling picks the variant, so only the type is compared then
+        if state is not None and state[0] == self.current_state()[0] and (
+                self.autotile or state[1] == self.tile_variant):
+            return
+        self.history.set_tile(x, y, self.current_state())
+        self.autotile_area(x - 1, y - 1, x + 1, y + 1)
+
+    def erase(self, x, y):
+        if self.cell_state(x, y) is None:
+            return
+        self.history.set_tile(x, y, None)
+        self.autotile_area(x - 1, y - 1, x + 1, y + 1)
+
+    def fill(self, area):
+        """Fill an area of cells with the selected tile, as one edit."""
+        left, top, right, bottom = area
+        state = self.current_state()
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                if self.cell_state(x, y) != state:
+                    self.history.set_tile(x, y, state)
+        self.autotile_area(left - 1, top - 1, right + 1, bottom + 1)
+        self.history.end()
+
+    def flood_fill(self, x, y, bounds):
+        """Fill the cells connected to a cell and holding the same tile, as one edit.
+
+        Args:
+            x (int): The cell x coordinate.
+            y (int): The cell y coordinate.
+            bounds (tuple): The (left, top, right, bottom) cells the fill can not leave,
+                empty areas having no border.
+        """
+        target = self.cell_state(x, y)
+        state = self.current_state()
+        if target == state:
+            return
+        left, top, right, bottom = bounds
+        filled = []
+        stack = [(x, y)]
+        while stack:
+            x, y = stack.pop()
+            if not (left <= x <= right and top <= y <= bottom) or self.cell_state(x, y) != target:
+                continue
+            self.history.set_tile(x, y, state)
+            filled.append((x, y))
+            stack += [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+        if filled:
+            self.autotile_area(min(cell[0] for cell in filled) - 1, min(cell[1] for cell in filled) - 1,
+                               max(cell[0] for cell in filled) + 1, max(cell[1] for cell in filled) + 1)
+        self.history.end()
+
+    def copy(self, area):
+        left, top, right, bottom = area
+        self.clipboard = [(tile["pos"][0] - left, tile["pos"][1] - top, tile["type"], tile["variant"])
+                          for tile in self.tilemap.tilemap.query(left, top, right, bottom)]
+
+    def paste(self, x, y):
+        """Write the copied tiles with their top left corner on a cell, as one edit."""
+        if not self.clipboard:
+            return
+        for offset_x, offset_y, tile_type, variant in self.clipboard:
+            if self.cell_state(x + offset_x, y + offset_y) != (tile_type, variant):
+                self.history.set_tile(x + offset_x, y + offset_y, (tile_type, variant))
+        self.autotile_area(x - 1, y - 1, x + max(tile[0] for tile in self.clipboard) + 1,
+                           y + max(tile[1] for tile in self.clipboard) + 1)
+        self.history.end()
 
     def run(self):
         while True:
-            self.display.blit(load_image("background.png"), (0, 0))
-
             self.scroll[0] += (self.movement[1] - self.movement[0]) * 2
             self.scroll[1] += (self.movement[3] - self.movement[2]) * 2
             render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
 
-            self.tilemap.render(self.display, offset=render_scroll)
-
-            current_tile_image = self.assets[self.tile_list[self.tile_group]][self.tile_variant].copy(
-            )
-            current_tile_image.set_alpha(100)
+            current_tile_image = self.tile_image()
 
-            mouse_position = pygame.mouse.get_pos()
-            mouse_position = (
-                mouse_position[0] / RENDER_SCALE,
-                mouse_position[1] / RENDER_SCALE)
+            mouse_position = self.presenter.to_display(pygame.mouse.get_pos())
             tile_position = (int((mouse_position[0] + self.scroll[0]) // self.tilemap.tile_size),
                              int((mouse_position[1] + self.scroll[1]) // self.tilemap.tile_size))
 
+            # Draw the current tile from the mouse position
             if self.on_grid:
-                # Draw the current tile from the mouse position
-                self.display.blit(current_tile_image, (
+                cursor_rect = current_tile_image.get_rect(topleft=(
                     tile_position[0] * self.tilemap.tile_size - self.scroll[0],
                     tile_position[1] * self.tilemap.tile_size - self.scroll[1]
                 ))
             else:
-                # Draw the current tile from the mouse position
-                self.display.blit(current_tile_image, mouse_position)
-
-            if self.clicking and self.on_grid:
-                self.tilemap.tilemap[f"{tile_position[0]};{tile_position[1]}"] = {
-                    "type": self.tile_list[self.tile_group],
-                    "variant": self.tile_variant,
-                    "pos": tile_position
-                }
+                cursor_rect = current_tile_image.get_rect(topleft=mouse_position)
+
+            if self.selecting:
+                self.selection = (min(self.selection_start[0], tile_position[0]),
+                                  min(self.selection_start[1], tile_position[1]),
+                                  max(self.selection_start[0], tile_position[0]),
+                                  max(self.selection_start[1], tile_position[1]))
+
+            # Idle frames are not drawn, and when only the cursor moves
+            # only its old and new places are pushed to the screen
+            frame_state = (render_scroll, self.tilemap.version, self.current_tile, self.selection)
+            if frame_state != self.frame_state or cursor_rect != self.cursor_rect:
+                self.display.blit(self.background, (0, 0))
+                self.tilemap.render(self.display, offset=render_scroll)
+                if self.selection is not None:
+                    left, top, right, bottom = self.selection
+                    pygame.draw.rect(self.display, (255, 255, 255), (
+                        left * self.tilemap.tile_size - render_scroll[0],
+                        top * self.tilemap.tile_size - render_scroll[1],
+                        (right - left + 1) * self.tilemap.tile_size,
+                        (bottom - top + 1) * self.tilemap.tile_size), 1)
+                self.display.blit(current_tile_image, cursor_rect)
+                self.display.blit(current_tile_image, (5, 5))
+
+                if frame_state == self.frame_state:
+                    self.presenter.mark_dirty(self.cursor_rect)
+                    self.presenter.mark_dirty(cursor_rect)
+                    self.presenter.present(full=False)
+                else:
+                    self.presenter.present()
+                self.frame_state = frame_state
+                self.cursor_rect = cursor_rect
+
+            # A stroke is one edit, from the button press to its release
+            if self.clicking and self.on_grid and not self.selecting:
+                self.paint(tile_position[0], tile_position[1])
             if self.right_clicking:
-                tile_location = f"{tile_position[0]};{tile_position[1]}"
-                if tile_location in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_location]
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    tile_image = self.assets[tile["type"]][tile["variant"]]
-                    tile_rect = pygame.Rect(
-                        tile["pos"][0] - self.scroll[0], tile["pos"][1] - self.scroll[1],
-                        tile_image.get_width(), tile_image.get_height()
-                    )
-                    if tile_rect.collidepoint(mouse_position):
-                        self.tilemap.offgrid_tiles.remove(tile)
-
-            self.display.blit(current_tile_image, (5, 5))
+                self.erase(tile_position[0], tile_position[1])
+                for key in self.tilemap.offgrid_at((
+                        mouse_position[0] + self.scroll[0], mouse_position[1] + self.scroll[1])):
+                    self.history.remove_offgrid(key)
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    # Let the save in progress finish
+                    self.saver.wait()
+                    self.saver.shutdown()
                     pygame.quit()
                     sys.exit()
 
                 if event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
+                    if event.button == 1 and self.ctrl:
+                        self.selecting = True
+                        self.selection_start = tile_position
+                    elif event.button == 1:
                         self.clicking = True
                         if not self.on_grid:
-                            self.tilemap.offgrid_tiles.append({
+                            self.history.add_offgrid({
                                 "type": self.tile_list[self.tile_group],
                                 "variant": self.tile_variant,
                                 "pos": (mouse_position[0] + self.scroll[0], mouse_position[1] + self.scroll[1])
                             })
+                            self.history.end()
                     if event.button == 3:
                         self.right_clicking = True
                     if self.shift:
@@ -134,26 +268,52 @@ class Editor:
                 if event.type == pygame.MOUSEBUTTONUP:
                     if event.button == 1:
                         self.clicking = False
+                        self.selecting = False
                     if event.button == 3:
                         self.right_clicking = False
+                    self.history.end()
 
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_q:
                         self.movement[0] = True
                     if event.key == pygame.K_d:
                         self.movement[1] = True
-                    if event.key == pygame.K_z:
+                    if event.key == pygame.K_z and not self.ctrl:
                         self.movement[2] = True
+                    if event.key == pygame.K_z and self.ctrl:
+                        self.history.undo()
+                    if event.key == pygame.K_y and self.ctrl:
+                        self.history.redo()
+                    if event.key == pygame.K_f and self.shift:
+                        self.flood_fill(tile_position[0], tile_position[1], (
+                            render_scroll[0] // self.tilemap.tile_size,
+                            render_scroll[1] // self.tilemap.tile_size,
+                            (render_scroll[0] + self.display.get_width()) // self.tilemap.tile_size,
+                            (render_scroll[1] + self.display.get_height()) // self.tilemap.tile_size))
+                    if event.key == pygame.K_f and not self.shift and self.selection is not None:
+                        self.fill(self.selection)
+                    if event.key == pygame.K_c and self.selection is not None:
+                        self.copy(self.selection)
+                    if event.key == pygame.K_v:
+                        self.paste(tile_position[0], tile_position[1])
+                    if event.key == pygame.K_ESCAPE:
+                        self.selection = None
                     if event.key == pygame.K_s and not self.shift:
                         self.movement[3] = True
                     if event.key == pygame.K_g:
                         self.on_grid = not self.on_grid
-                    if event.key == pygame.K_t:
+                    if event.key == pygame.K_t and not self.shift:
                         self.tilemap.autotile()
+                    if event.key == pygame.K_t and self.shift:
+                        # Keep autotiling the edited cells while painting
+                        self.autotile = not self.autotile
                     if event.key == pygame.K_s and self.shift:
-                        self.tilemap.save("map.json")
+                        pygame.display.set_caption("Level editor")
+                        self.saver.save()
                     if event.key == pygame.K_LSHIFT:
                         self.shift = True
+                    if event.key in (pygame.K_LCTRL, pygame.K_RCTRL):
+                        self.ctrl = True
 
                 if event.type == pygame.KEYUP:
                     if event.key == pygame.K_q:
@@ -166,10 +326,14 @@ class Editor:
                         self.movement[3] = False
                     if event.key == pygame.K_LSHIFT:
                         self.shift = False
+                    if event.key in (pygame.K_LCTRL, pygame.K_RCTRL):
+                        self.ctrl = False
 
-            self.screen.blit(pygame.transform.scale(
-                self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
+            self.saver.update()
+            if self.saver.error is not None:
+                print(f"Saving {MAP_PATH} failed: {self.saver.error!r}", file=sys.stderr)
+                pygame.display.set_caption(f"Level editor - save failed: {self.saver.error}")
+                self.saver.error = None
             self.clock.tick(60)  # 60 FPS
 
 
@@ -1,24 +1,57 @@
+import argparse
+import random
 import sys
 import pygame
 
+from libs.assets import AssetManager
+from libs.audio import AudioManager
 from libs.clouds import Clouds
 from libs.entities import Player
-from libs.tilemap import Tilemap
-from libs.utils import Animation, load_image, load_images
+from libs.entity_manager import EntityManager
+from libs.levels import LevelManager, compiled_path, level_paths
+from libs.navigation import FlowField
+from libs.parallax import Parallax, ParallaxLayer
+from libs.particles import Emitter, ParticleSystem
+from libs.presenter import Presenter
+from libs.profiler import profiler
+from libs.projectiles import OWNER_PLAYER, ProjectileManager
+from libs.replay import (INPUT_JUMP, INPUT_LEFT, INPUT_RIGHT, INPUT_SHOOT, InputRecorder,
+                         pack_input, state_hash)
+from libs.timestep import REFERENCE_RATE, FixedTimestep
+
+DISPLAY_SIZE = (320, 240)
+WINDOW_SIZE = (640, 480)  # scaled by the largest integer factor fitting it
+SCALED_MODE = False  # let pygame scale the display, WINDOW_SIZE is then ignored
+SIM_RATE = 60
+FPS_CAP = 60  # 0 renders as fast as possible
+PROFILE_TRACE = "profile_trace.json"  # F4 exports the profiler frames, .csv also works
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, levels=None, seed=None, record=None):
+        """Open the window, load the assets and start the first level.
+
+        Args:
+            levels (list): The maps to play in order, the ones of assets/maps by default.
+            seed (int): The seed of the enemies, random by default.
+            record (str): Record the input of every tick to this replay file.
+        """
         pygame.init()
 
-        pygame.display.set_caption("Ninja game")
-        self.screen = pygame.display.set_mode((640, 480))
-        self.display = pygame.Surface((320, 240))
+        self.presenter = Presenter("Ninja game", DISPLAY_SIZE, WINDOW_SIZE, scaled_mode=SCALED_MODE)
+        self.display = self.presenter.display
 
         self.clock = pygame.time.Clock()
+        self.timestep = FixedTimestep(SIM_RATE)
 
         self.movement = [False, False]
+        self.jumping = False
+        self.shooting = False
 
+        self.asset_manager = AssetManager()
+        load_image = self.asset_manager.load_image
+        load_images = self.asset_manager.load_images
+        load_animation = self.asset_manager.load_animation
         self.assets = {
             "decor": load_images("tiles/decor"),
             "grass": load_images("tiles/grass"),
@@ -27,69 +60,206 @@ class Game:
             "player": load_image("entities/player.png"),
             "background": load_image("background.png"),
             "clouds": load_images("clouds"),
-            "player/idle": Animation(load_images("entities/player/idle"), image_duration=6),
-            "player/run": Animation(load_images("entities/player/run"), image_duration=4),
-            "player/jump": Animation(load_images("entities/player/jump")),
-            "player/slide": Animation(load_images("entities/player/slide")),
-            "player/wall_slide": Animation(load_images("entities/player/wall_slide")),
+            "gun": load_image("gun.png"),
+            "projectile": load_image("projectile.png"),
+            "player/idle": load_animation("entities/player/idle", image_duration=6),
+            "player/run": load_animation("entities/player/run", image_duration=4),
+            "player/jump": load_animation("entities/player/jump"),
+            "player/slide": load_animation("entities/player/slide"),
+            "player/wall_slide": load_animation("entities/player/wall_slide"),
+            "enemy/idle": load_animation("entities/enemy/idle", image_duration=6),
+            "enemy/run": load_animation("entities/enemy/run", image_duration=4),
+            "particle/leaf": load_animation("particles/leaf", image_duration=20, loop=False),
+            "particle/particle": load_animation("particles/particle", image_duration=6, loop=False),
         }
+        self.assets["gun/flipped"] = self.asset_manager.flip(self.assets["gun"])
+
+        self.audio = AudioManager()
 
         self.player = Player(self, (50, 50), (8, 15))
+        self.projectiles = ProjectileManager(self.assets["projectile"])
 
-        self.tilemap = Tilemap(self, tile_size=16)
+        self.particles = ParticleSystem()
+        self.particles.register("leaf", self.assets["particle/leaf"], sway=0.3)
+        self.particles.register("particle", self.assets["particle/particle"])
 
-        try:
-            self.tilemap.load("map.json")
-        except FileNotFoundError:
-            pass
+        if levels is None:
+            levels = level_paths()
+        if seed is None:
+            seed = random.randrange(1 << 32)
+        self.seed = seed
+        self.recorder = InputRecorder(record, levels, SIM_RATE, seed) if record else None
+        self.levels = LevelManager(self, levels)
+        self.start_level(0)
 
+        self.background = Parallax()
+        self.background.add_layer(ParallaxLayer([(self.assets["background"], (0, 0))], depth=0, margin=(0, 0)))
         self.clouds = Clouds(self.assets["clouds"], count=16)
 
-        self.scroll = [0, 0]
+    def start_level(self, index):
+        """Swap in a level, loaded in the background while the previous one was played."""
+        level = self.levels.load(index)
+        self.level = index
+        self.tilemap = level.tilemap
+        self.navigation = FlowField(self.tilemap)
 
-    def run(self):
-        while True:
-            self.display.blit(self.assets["background"], (0, 0))
+        self.player.velocity = [0, 0]
+        self.touching_enemy = False
+        self.enemies = EntityManager(self, "enemy", seed=self.seed + index)
+        for spawner in level.spawners:
+            if spawner["variant"] == 0:
+                self.player.position = list(spawner["pos"])
+                self.player.last_position = list(spawner["pos"])
+            else:
+                self.enemies.spawn(spawner["pos"], (8, 15))
+        self.scroll = [self.player.rect().centerx - self.display.get_width() / 2,
+                       self.player.rect().centery - self.display.get_height() / 2]
+        self.last_scroll = list(self.scroll)
+
+        self.projectiles.clear()
+        self.particles.clear()
+        # Leaves fall from the foliage of the trees
+        self.leaves = Emitter(self.particles, "leaf", [
+            (tree["pos"][0] + 4, tree["pos"][1] + 4, 23, 13) for tree in level.trees],
+            velocity=(-0.1, 0.3), frames=20)
+
+        self.levels.prepare(index + 1)
+
+    def update(self, dt, inputs=None):
+        """Simulate one tick.
+
+        Args:
+            dt (float): The length of the tick, in reference ticks.
+            inputs (int): The INPUT_* bits of the tick, read from the keyboard by default.
+        """
+        if inputs is None:
+            inputs = pack_input(self.movement, self.jumping, self.shooting)
+            self.jumping = False
+            self.shooting = False
+        if self.recorder is not None:
+            self.recorder.record(inputs)
+
+        with profiler.section("player"):
+            if inputs & INPUT_JUMP:
+                self.player.velocity[1] = -3
+                self.audio.play("jump")
+            self.player.update(
+                self.tilemap, (bool(inputs & INPUT_RIGHT) - bool(inputs & INPUT_LEFT), 0), dt=dt)
+        with profiler.section("enemies"):
+            player_rect = self.player.rect()
+            self.navigation.update((player_rect.centerx, player_rect.bottom - 1))
+            self.enemies.update(self.tilemap, dt=dt, flow_field=self.navigation)
+            # Touching an enemy bounces the player off it, once per contact
+            touching = bool(self.enemies.query(self.player.rect()))
+            if touching and not self.touching_enemy:
+                self.player.velocity[1] = -2
+                self.audio.play("hit")
+            self.touching_enemy = touching
+        with profiler.section("projectiles"):
+            if inputs & INPUT_SHOOT and self.player.shoot(self.projectiles):
+                self.audio.play("shoot")
+            impacts = self.projectiles.update(self.tilemap, dt=dt)
+            for slot, position in self.projectiles.hits(self.enemies.index, OWNER_PLAYER):
+                self.enemies.kill(slot)
+                self.audio.play("hit")
+                impacts.append(position)
+            for position in impacts:
+                for number in range(4):
+                    self.particles.spawn("particle", position, ((number - 1.5) * 0.5, -0.5 + number % 2 * 0.3))
+        with profiler.section("particles"):
+            view = pygame.Rect(self.scroll[0], self.scroll[1], self.display.get_width(), self.display.get_height())
+            self.leaves.update(view, dt=dt)
+            self.particles.update(dt=dt)
+        with profiler.section("levels"):
+            self.levels.update()
+
+        if not len(self.enemies) and self.level + 1 < len(self.levels):
+            self.start_level(self.level + 1)
+
+        self.last_scroll = list(self.scroll)
+        self.scroll[0] += (self.player.rect().centerx -
+                           self.display.get_width() / 2 - self.scroll[0]) / 30 * dt
+        self.scroll[1] += (self.player.rect().centery -
+                           self.display.get_height() / 2 - self.scroll[1]) / 30 * dt
 
-            self.scroll[0] += (self.player.rect().centerx -
-                               self.display.get_width() / 2 - self.scroll[0]) / 30
-            self.scroll[1] += (self.player.rect().centery -
-                               self.display.get_height() / 2 - self.scroll[1]) / 30
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+    def render(self, alpha, elapsed):
+        render_scroll = (int(self.last_scroll[0] + (self.scroll[0] - self.last_scroll[0]) * alpha),
+                         int(self.last_scroll[1] + (self.scroll[1] - self.last_scroll[1]) * alpha))
 
-            self.clouds.update()
+        # Clouds are only decoration, they move with the frame time
+        with profiler.section("clouds"):
+            self.background.render(self.display, offset=render_scroll)
+            self.clouds.update(elapsed * REFERENCE_RATE)
             self.clouds.render(self.display, offset=render_scroll)
 
+        with profiler.section("tilemap"):
             self.tilemap.render(self.display, offset=render_scroll)
 
-            self.player.update(
-                self.tilemap, (self.movement[1] - self.movement[0], 0))
-            self.player.render(self.display, offset=render_scroll)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_LEFT:
-                        self.movement[0] = True
-                    if event.key == pygame.K_RIGHT:
-                        self.movement[1] = True
-                    if event.key == pygame.K_UP:
-                        self.player.velocity[1] = -3
-
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_LEFT:
-                        self.movement[0] = False
-                    if event.key == pygame.K_RIGHT:
-                        self.movement[1] = False
-
-            self.screen.blit(pygame.transform.scale(
-                self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
-            self.clock.tick(60)  # 60 FPS
+        with profiler.section("entities"):
+            self.enemies.render(self.display, offset=render_scroll, alpha=alpha)
+            self.player.render(self.display, offset=render_scroll, alpha=alpha)
+            self.projectiles.render(self.display, offset=render_scroll)
+
+        with profiler.section("particles"):
+            self.particles.render(self.display, offset=render_scroll)
+
+        profiler.render(self.display)
+
+        with profiler.section("present"):
+            self.presenter.present()
+
+    def handle_events(self):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                if self.recorder is not None:
+                    self.recorder.save(state_hash(self))
+                self.levels.shutdown()
+                self.audio.stop()
+                pygame.quit()
+                sys.exit()
+
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_LEFT:
+                    self.movement[0] = True
+                if event.key == pygame.K_RIGHT:
+                    self.movement[1] = True
+                if event.key == pygame.K_UP:
+                    self.jumping = True
+                if event.key == pygame.K_x:
+                    self.shooting = True
+                if event.key == pygame.K_F3:
+                    profiler.toggle()
+                if event.key == pygame.K_F4:
+                    profiler.export(PROFILE_TRACE)
+
+            if event.type == pygame.KEYUP:
+                if event.key == pygame.K_LEFT:
+                    self.movement[0] = False
+                if event.key == pygame.K_RIGHT:
+                    self.movement[1] = False
+
+    def run(self):
+        self.audio.play_music()
+        self.audio.play_ambience()
+        while True:
+            profiler.end_frame()
+            with profiler.section("events"):
+                self.handle_events()
+
+            with profiler.section("wait"):
+                elapsed = self.clock.tick(FPS_CAP) / 1000
+            for _ in range(self.timestep.advance(elapsed)):
+                self.update(self.timestep.scale())
+
+            self.render(self.timestep.alpha(), elapsed)
 
 
 if __name__ == "__main__":
-    Game().run()
+    parser = argparse.ArgumentParser(description="Play the ninja game.")
+    parser.add_argument("--map", action="append", help="a map to play, like map.json, the levels of assets/maps by default")
+    parser.add_argument("--seed", type=int, help="the seed of the enemies, random by default")
+    parser.add_argument("--record", help="record the session to a replay file, see replay.py")
+    args = parser.parse_args()
+
+    levels = [compiled_path(path) for path in args.map] if args.map else None
+    Game(levels=levels, seed=args.seed, record=args.record).run()
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+
+import pygame
+
+from libs.utils import ASSETS_IMAGE, Animation, atomic_write
+
+ASSETS_CACHE = ".cache/assets/"
+ATLAS_SIZE = 1024
+
+
+def pack(sizes, page_size=ATLAS_SIZE):
+    """Place rectangles on pages, row by row, tallest first.
+
+    Args:
+        sizes (dict): The (width, height) of each rectangle, by name.
+        page_size (int): The width and height of a page.
+
+    Returns:
+        tuple: The (width, height) of each page, and the
+            (page, x, y, width, height) of each rectangle by name.
+    """
+    pages = []
+    places = {}
+    page = None
+    x = y = row_height = 0
+    for name in sorted(sizes, key=lambda name: (-sizes[name][1], name)):
+        width, height = sizes[name]
+        if width > page_size or height > page_size:
+            pages.append((width, height))
+            places[name] = (len(pages) - 1, 0, 0, width, height)
+            continue
+        if page is not None and x + width > page_size:
+            x = 0
+            y += row_height
+            row_height = 0
+        if page is None or y + height > page_size:
+            pages.append((page_size, page_size))
+            page = len(pages) - 1
+            x = y = row_height = 0
+        places[name] = (page, x, y, width, height)
+        x += width
+        row_height = max(row_height, height)
+
+    return pages, places
+
+
+class AssetManager:
+    """Images of assets/images packed into atlases and cached on disk.
+
+    The first run decodes every image and packs them into atlas pages, which
+    are saved in the cache with their index. Next runs only decode the
+    pages, as long as no image was added, removed or modified since. Every
+    image is handed out as a shared subsurface of its page.
+    """
+
+    def __init__(self, root=ASSETS_IMAGE, cache_dir=ASSETS_CACHE):
+        self.root = root
+        self.cache_dir = cache_dir
+        self.pages = []
+        self.images = {}
+        self.flipped = {}
+        self.load()
+
+    def scan(self):
+        files = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".png"):
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+                    files.append((os.path.relpath(path, self.root).replace(os.sep, "/"),
+                                  stat.st_mtime_ns, stat.st_size))
+
+        return sorted(files)
+
+    def load(self):
+        files = self.scan()
+        key = hashlib.sha1(json.dumps(files).encode("utf-8")).hexdigest()[:16]
+        index_path = os.path.join(self.cache_dir, f"atlas-{key}.json")
+
+        try:
+            with open(index_path, "r") as file_content:
+                index = json.load(file_content)
+            pages = [pygame.image.load(os.path.join(self.cache_dir, f"atlas-{key}-{page}.png"))
+                     for page in range(len(index["pages"]))]
+        except (FileNotFoundError, pygame.error, ValueError, KeyError):
+            index, pages = self.build([name for name, _, _ in files], key)
+
+        if pygame.display.get_surface() is not None:
+            pages = [page.convert() for page in pages]
+        for page in pages:
+            page.set_colorkey((0, 0, 0))
+        self.pages = pages
+        self.images = {name: pages[place[0]].subsurface(place[1:])
+                       for name, place in index["images"].items()}
+
+    def build(self, names, key):
+        decoded = {name: pygame.image.load(self.root + name) for name in names}
+        page_sizes, places = pack({name: image.get_size() for name, image in decoded.items()})
+
+        pages = [pygame.Surface(size) for size in page_sizes]
+        for name, place in places.items():
+            pages[place[0]].blit(decoded[name], place[1:3])
+
+        index = {"pages": page_sizes, "images": places}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for name in os.listdir(self.cache_dir):
+                if name.startswith("atlas-"):
+                    os.remove(os.path.join(self.cache_dir, name))
+            for number, page in enumerate(pages):
+                pygame.image.save(page, os.path.join(self.cache_dir, f"atlas-{key}-{number}.png"))
+            atomic_write(os.path.join(self.cache_dir, f"atlas-{key}.json"), json.dumps(index))
+        except OSError:
+            # The cache only speeds up the next start, the game runs without it
+            pass
+
+        return index, pages
+
+    def load_image(self, path):
+        """Get an image, with the colorkey set to black (for transparency).
+
+        Args:
+            path (str): The path to the image file, in assets/images.
+
+        Returns:
+            pygame.Surface: The image, shared with every other caller.
+        """
+        return self.images[path]
+
+    def load_images(self, path):
+        """Get the images of a folder, sorted by file name.
+
+        Args:
+            path (str): The path to the images folder, in assets/images.
+
+        Returns:
+            list: The images of the folder.
+        """
+        prefix = path.rstrip("/") + "/"
+        return [self.images[name] for name in sorted(self.images)
+                if name.startswith(prefix) and "/" not in name[len(prefix):]]
+
+    def load_animation(self, path, image_duration=5, loop=True):
+        return Animation(self.load_images(path), image_duration=image_duration, loop=loop)
+
+    def flip(self, image):
+        """Get the horizontally flipped copy of an image, made only once."""
+        flipped = self.flipped.get(id(image))
+        if flipped is None:
+            flipped = self.flipped[id(image)] = pygame.transform.flip(image, True, False)
+
+        return flipped
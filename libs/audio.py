@@ -0,0 +1,115 @@
+import os
+
+import pygame
+
+SFX_DIR = "assets/sfx/"
+MUSIC_PATH = "assets/music.wav"
+AMBIENCE = "ambience"
+
+CHANNEL_COUNT = 16
+AMBIENCE_CHANNEL = 0
+
+SOUND_VOLUMES = {"ambience": 0.2, "dash": 0.3, "hit": 0.8, "jump": 0.7, "shoot": 0.4}
+# Higher priorities can take the channel of a lower or equal one when all are busy
+SOUND_PRIORITIES = {"hit": 3, "dash": 2, "jump": 2, "shoot": 1}
+MUSIC_VOLUME = 0.5
+
+
+class AudioManager:
+    """Sound effects decoded once, streamed music and a pool of channels.
+
+    Effects are decoded at startup and shared by every play. They play on a
+    fixed pool of channels: when every channel is busy, a new sound takes
+    the channel of the oldest sound of the lowest priority, if it is not
+    above its own, or is dropped. Music is streamed from disk by the mixer,
+    and the ambience loops on a channel of its own.
+
+    When the mixer can not start, like without a sound card, every method
+    does nothing and the game runs silent.
+    """
+
+    def __init__(self, sfx_dir=SFX_DIR, channels=CHANNEL_COUNT,
+                 volumes=SOUND_VOLUMES, priorities=SOUND_PRIORITIES):
+        self.sfx_dir = sfx_dir
+        self.priorities = priorities
+        self.sounds = {}
+        self.channels = []
+        self.playing = []
+        self.plays = 0
+        self.enabled = False
+
+        try:
+            if not pygame.mixer.get_init():
+                pygame.mixer.init()
+            pygame.mixer.set_num_channels(channels)
+            pygame.mixer.set_reserved(AMBIENCE_CHANNEL + 1)
+        except pygame.error:
+            return
+        self.enabled = True
+        self.channels = [pygame.mixer.Channel(number) for number in range(AMBIENCE_CHANNEL + 1, channels)]
+        # (priority, play number) of the last sound started on each channel
+        self.playing = [(0, 0)] * len(self.channels)
+
+        for name in sorted(os.listdir(sfx_dir)):
+            sound_name, extension = os.path.splitext(name)
+            if extension not in (".wav", ".ogg"):
+                continue
+            try:
+                sound = pygame.mixer.Sound(os.path.join(sfx_dir, name))
+            except pygame.error:
+                # A sound that can not be decoded is only missing
+                continue
+            sound.set_volume(volumes.get(sound_name, 1.0))
+            self.sounds[sound_name] = sound
+
+    def play(self, name):
+        """Play a sound effect on a free channel, or steal one.
+
+        Args:
+            name (str): The name of the sound, its file name without extension.
+
+        Returns:
+            bool: False if the sound was dropped.
+        """
+        sound = self.sounds.get(name)
+        if sound is None:
+            return False
+        priority = self.priorities.get(name, 0)
+        self.plays += 1
+
+        victim = None
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                victim = index
+                break
+            if victim is None or self.playing[index] < self.playing[victim]:
+                victim = index
+        if self.channels[victim].get_busy() and self.playing[victim][0] > priority:
+            return False
+
+        self.channels[victim].play(sound)
+        self.playing[victim] = (priority, self.plays)
+
+        return True
+
+    def play_music(self, path=MUSIC_PATH, volume=MUSIC_VOLUME):
+        """Stream a music from disk, in a loop."""
+        if not self.enabled:
+            return
+        try:
+            pygame.mixer.music.load(path)
+        except pygame.error:
+            return
+        pygame.mixer.music.set_volume(volume)
+        pygame.mixer.music.play(-1)
+
+    def play_ambience(self, name=AMBIENCE):
+        """Loop a sound on the channel kept for the ambience."""
+        sound = self.sounds.get(name)
+        if sound is not None:
+            pygame.mixer.Channel(AMBIENCE_CHANNEL).play(sound, loops=-1)
+
+    def stop(self):
+        if self.enabled:
+            pygame.mixer.music.stop()
+            pygame.mixer.stop()
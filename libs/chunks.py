@@ -0,0 +1,207 @@
+CHUNK_SHIFT = 3
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+CHUNK_AREA = CHUNK_SIZE * CHUNK_SIZE
+
+
+def chunk_position(x, y):
+    """Get the chunk holding a cell.
+
+    Args:
+        x (int): The cell x coordinate.
+        y (int): The cell y coordinate.
+
+    Returns:
+        tuple: The (x, y) coordinates of the chunk.
+    """
+    return (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+
+
+def chunk_index(x, y):
+    """Get the index of a cell inside its chunk.
+
+    Args:
+        x (int): The cell x coordinate.
+        y (int): The cell y coordinate.
+
+    Returns:
+        int: The row-major index of the cell in the chunk.
+    """
+    return ((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+
+
+class TileChunk:
+    def __init__(self, position):
+        self.position = position
+        self.tiles = [None] * CHUNK_AREA
+        self.count = 0
+
+    def origin(self):
+        return (self.position[0] << CHUNK_SHIFT, self.position[1] << CHUNK_SHIFT)
+
+
+class ChunkedTileStore:
+    """Grid tiles stored in fixed-size chunks with integer coordinates.
+
+    Cells are grouped in CHUNK_SIZE x CHUNK_SIZE chunks, each chunk being a
+    flat list indexed by the cell position inside it. Empty chunks are
+    dropped, so memory and queries only scale with the filled area.
+
+    Chunks can also be left in a source, like a memory-mapped map file, and
+    only decoded the first time they are accessed.
+    """
+
+    def __init__(self):
+        self.chunks = {}
+        self.count = 0
+        self.pending = {}
+        self.source = None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, position):
+        return self.get(position[0], position[1]) is not None
+
+    def __iter__(self):
+        self.load_all()
+        for chunk in list(self.chunks.values()):
+            for tile in chunk.tiles:
+                if tile is not None:
+                    yield tile
+
+    def attach(self, source):
+        """Replace the tiles with the chunks of a source, decoded lazily.
+
+        Args:
+            source: An object with a `counts` dict giving the number of tiles
+                of each chunk position, a `read_chunk(position)` method
+                returning a TileChunk and a `close()` method.
+        """
+        self.clear()
+        self.source = source
+        self.pending = dict(source.counts)
+        self.count = sum(self.pending.values())
+        if not self.pending:
+            self.detach()
+
+    def detach(self):
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+        self.pending = {}
+
+    def decode(self, position):
+        del self.pending[position]
+        chunk = self.chunks[position] = self.source.read_chunk(position)
+        if not self.pending:
+            self.detach()
+
+        return chunk
+
+    def load_all(self):
+        for position in list(self.pending):
+            self.decode(position)
+
+    def chunk(self, position):
+        """Get a chunk, decoding it from the source if needed.
+
+        Args:
+            position (tuple): The (x, y) coordinates of the chunk.
+
+        Returns:
+            TileChunk: The chunk, None if it holds no tile.
+        """
+        chunk = self.chunks.get(position)
+        if chunk is None and position in self.pending:
+            chunk = self.decode(position)
+
+        return chunk
+
+    def get(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            if not self.pending:
+                return None
+            chunk = self.chunk((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if chunk is None:
+                return None
+        return chunk.tiles[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+    def set(self, x, y, tile):
+        position = chunk_position(x, y)
+        chunk = self.chunk(position)
+        if chunk is None:
+            chunk = self.chunks[position] = TileChunk(position)
+        index = chunk_index(x, y)
+        if chunk.tiles[index] is None:
+            chunk.count += 1
+            self.count += 1
+        chunk.tiles[index] = tile
+
+    def remove(self, x, y):
+        position = chunk_position(x, y)
+        chunk = self.chunk(position)
+        if chunk is None:
+            return None
+        index = chunk_index(x, y)
+        tile = chunk.tiles[index]
+        if tile is not None:
+            chunk.tiles[index] = None
+            chunk.count -= 1
+            self.count -= 1
+            if not chunk.count:
+                del self.chunks[position]
+
+        return tile
+
+    def clear(self):
+        self.detach()
+        self.chunks = {}
+        self.count = 0
+
+    def query(self, x0, y0, x1, y1):
+        """Iterate over the tiles inside a rectangle of cells.
+
+        Tiles are yielded column by column, top to bottom, and empty chunks
+        are skipped without looking at their cells.
+
+        Args:
+            x0 (int): The left cell, inclusive.
+            y0 (int): The top cell, inclusive.
+            x1 (int): The right cell, inclusive.
+            y1 (int): The bottom cell, inclusive.
+
+        Yields:
+            dict: The tiles found in the rectangle.
+        """
+        chunks = self.chunks
+        for x in range(x0, x1 + 1):
+            chunk_x = x >> CHUNK_SHIFT
+            local_x = x & CHUNK_MASK
+            for chunk_y in range(y0 >> CHUNK_SHIFT, (y1 >> CHUNK_SHIFT) + 1):
+                chunk = chunks.get((chunk_x, chunk_y))
+                if chunk is None:
+                    if (chunk_x, chunk_y) not in self.pending:
+                        continue
+                    chunk = self.decode((chunk_x, chunk_y))
+                tiles = chunk.tiles
+                top = chunk_y << CHUNK_SHIFT
+                for y in range(max(y0, top), min(y1, top + CHUNK_MASK) + 1):
+                    tile = tiles[((y & CHUNK_MASK) << CHUNK_SHIFT) | local_x]
+                    if tile is not None:
+                        yield tile
+
+    def to_json(self):
+        """Export the tiles with the "x;y" keys used by the map files."""
+        return {f"{tile['pos'][0]};{tile['pos'][1]}": tile for tile in self}
+
+    def load_json(self, tiles):
+        """Replace the tiles with the ones from a map file.
+
+        Args:
+            tiles (dict): The tiles keyed by "x;y" strings.
+        """
+        self.clear()
+        for tile in tiles.values():
+            self.set(int(tile["pos"][0]), int(tile["pos"][1]), tile)
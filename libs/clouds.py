@@ -1,43 +1,26 @@
-
 import random
 
+from libs.parallax import Parallax, ParallaxLayer
 
-class Cloud:
-    def __init__(self, position, image, speed, depth):
-        self.position = list(position)
-        self.image = image
-        self.speed = speed
-        self.depth = depth
-
-    def update(self):
-        self.position[0] += self.speed
-
-    def render(self, surface, offset=(0, 0)):
-        render_position = (
-            self.position[0] - offset[0] * self.depth, self.position[1] - offset[1] * self.depth)
-        surface.blit(self.image, (render_position[0] % (surface.get_width() + self.image.get_width()) - self.image.get_width(
-        ), render_position[1] % (surface.get_height() + self.image.get_height()) - self.image.get_height()))
 
+class Clouds(Parallax):
+    """Clouds drifting in depth bands, each band being one parallax layer.
 
-class Clouds:
-    def __init__(self, cloud_images, count=16):
-        self.clouds = []
+    Every cloud gets a random depth, the clouds of a band share the depth
+    and the speed of the band, so drawing them costs the same whatever
+    their number. Clouds used to have their own depth and speed: within a
+    band they now move together, which is the price of baking them.
+    """
 
+    def __init__(self, cloud_images, count=16, bands=4):
+        super().__init__()
+        items = [[] for _ in range(bands)]
         for _ in range(count):
-            cloud = Cloud(
-                (random.random() * 99999, random.random() * 99999),
-                random.choice(cloud_images),
-                random.random() * 0.05 + 0.05,
-                random.random() * 0.6 + 0.2
-            )
-            self.clouds.append(cloud)
-
-        self.clouds.sort(key=lambda x: x.depth)
-
-    def update(self):
-        for cloud in self.clouds:
-            cloud.update()
-
-    def render(self, surface, offset=(0, 0)):
-        for cloud in self.clouds:
-            cloud.render(surface, offset=offset)
+            depth = random.random() * 0.6 + 0.2
+            band = min(bands - 1, int((depth - 0.2) / 0.6 * bands))
+            items[band].append((random.choice(cloud_images), (random.random(), random.random())))
+
+        for band, band_items in enumerate(items):
+            if band_items:
+                self.add_layer(ParallaxLayer(band_items, depth=0.2 + 0.6 * (band + 0.5) / bands),
+                               speed=random.random() * 0.05 + 0.05)
@@ -0,0 +1,320 @@
+import math
+
+import pygame
+
+from libs.chunks import CHUNK_AREA, CHUNK_MASK, CHUNK_SHIFT, CHUNK_SIZE
+from libs.profiler import profiler
+
+
+class CollisionChunk:
+    def __init__(self, position, mask, rects, cells):
+        self.position = position
+        self.mask = mask
+        self.rects = rects
+        self.cells = cells
+
+
+class CollisionGrid:
+    """Solid cells of a tilemap, merged into as few rectangles as possible.
+
+    Each chunk keeps a bitmask of its solid cells, the rectangles obtained by
+    merging runs of solid cells, and for every cell the index of the
+    rectangle covering it. Chunks are built once and only built again after
+    an edit, so queries never allocate rectangles. Compiled maps already
+    hold the masks and rectangles, their chunks are then unpacked without
+    looking at the tiles.
+    """
+
+    def __init__(self, tilemap, solid_types):
+        self.tilemap = tilemap
+        self.solid_types = solid_types
+        self.chunks = {}
+        self.compiled = {}
+        self.around = []
+
+    def invalidate(self, position):
+        self.chunks.pop(position, None)
+        self.compiled.pop(position, None)
+
+    def clear(self):
+        self.chunks = {}
+        self.compiled = {}
+
+    def load_compiled(self, compiled):
+        """Use the collision data of a compiled map.
+
+        Args:
+            compiled (dict): (mask, rects) by chunk position, rects being
+                (left, top, width, height) in cells from the chunk origin.
+        """
+        self.compiled = dict(compiled)
+
+    def export(self):
+        """Get the collision data of every chunk, as stored in compiled maps.
+
+        Returns:
+            list: (position, mask, rects) of each chunk, rects being
+            (left, top, width, height) in cells from the chunk origin.
+        """
+        self.build_all()
+        tile_size = self.tilemap.tile_size
+        exported = []
+        for position in sorted(self.chunks):
+            chunk = self.chunks[position]
+            origin_x, origin_y = position[0] << CHUNK_SHIFT, position[1] << CHUNK_SHIFT
+            exported.append((position, chunk.mask, [
+                (rect.x // tile_size - origin_x, rect.y // tile_size - origin_y,
+                 rect.width // tile_size, rect.height // tile_size) for rect in chunk.rects]))
+
+        return exported
+
+    def build_all(self):
+        for position in set(self.tilemap.tilemap.chunks) | set(self.compiled):
+            self.chunk(position)
+
+    def chunk(self, position):
+        chunk = self.chunks.get(position)
+        if chunk is None:
+            compiled = self.compiled.get(position)
+            if compiled is not None:
+                chunk = self.chunks[position] = self.unpack(position, *compiled)
+                return chunk
+            tiles = self.tilemap.tilemap.chunk(position)
+            if tiles is None:
+                return None
+            chunk = self.chunks[position] = self.build(tiles)
+
+        return chunk
+
+    def unpack(self, position, mask, cell_rects):
+        tile_size = self.tilemap.tile_size
+        origin_x, origin_y = position[0] << CHUNK_SHIFT, position[1] << CHUNK_SHIFT
+        rects = []
+        cells = [-1] * CHUNK_AREA
+        for index, (left, top, width, height) in enumerate(cell_rects):
+            rects.append(pygame.Rect((origin_x + left) * tile_size, (origin_y + top) * tile_size,
+                                     width * tile_size, height * tile_size))
+            for y in range(top, top + height):
+                for x in range(left, left + width):
+                    cells[(y << CHUNK_SHIFT) | x] = index
+
+        profiler.count("rect_allocations", len(rects))
+        return CollisionChunk(position, mask, rects, cells)
+
+    def build(self, tiles):
+        mask = 0
+        for index, tile in enumerate(tiles.tiles):
+            if tile is not None and tile["type"] in self.solid_types:
+                mask |= 1 << index
+
+        tile_size = self.tilemap.tile_size
+        origin = tiles.origin()
+        rects = []
+        cells = [-1] * CHUNK_AREA
+        # Runs of solid cells on a row are merged first, then a run is
+        # stretched down while the next row has a run with the same bounds.
+        open_runs = {}
+        for y in range(CHUNK_SIZE):
+            row = (mask >> (y << CHUNK_SHIFT)) & ((1 << CHUNK_SIZE) - 1)
+            runs = {}
+            x = 0
+            while x < CHUNK_SIZE:
+                if not row >> x & 1:
+                    x += 1
+                    continue
+                start = x
+                while x < CHUNK_SIZE and row >> x & 1:
+                    x += 1
+                index = open_runs.get((start, x))
+                if index is None:
+                    index = len(rects)
+                    rects.append(pygame.Rect(
+                        (origin[0] + start) * tile_size, (origin[1] + y) * tile_size,
+                        (x - start) * tile_size, tile_size))
+                else:
+                    rects[index].height += tile_size
+                runs[(start, x)] = index
+                for cell_x in range(start, x):
+                    cells[(y << CHUNK_SHIFT) | cell_x] = index
+            open_runs = runs
+
+        profiler.count("rect_allocations", len(rects))
+        return CollisionChunk(tiles.position, mask, rects, cells)
+
+    def is_solid(self, x, y):
+        """Check if a cell holds a solid tile.
+
+        Args:
+            x (int): The cell x coordinate.
+            y (int): The cell y coordinate.
+
+        Returns:
+            bool: True if the cell blocks movement.
+        """
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            chunk = self.chunk((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if chunk is None:
+                return False
+
+        return bool(chunk.mask >> (((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)) & 1)
+
+    def rect_at(self, x, y):
+        chunk = self.chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+        if chunk is None:
+            chunk = self.chunk((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT))
+            if chunk is None:
+                return None
+        index = chunk.cells[((y & CHUNK_MASK) << CHUNK_SHIFT) | (x & CHUNK_MASK)]
+
+        return chunk.rects[index] if index >= 0 else None
+
+    def rects_around(self, x, y, offsets):
+        """Get the merged rectangles touching cells around a cell.
+
+        The returned list and its rectangles are shared between calls, they
+        must be neither kept nor modified by the caller.
+
+        Args:
+            x (int): The center cell x coordinate.
+            y (int): The center cell y coordinate.
+            offsets (list): The (x, y) offsets of the cells to look at.
+
+        Returns:
+            list: The rectangles, without duplicates.
+        """
+        around = self.around
+        around.clear()
+        chunks = self.chunks
+        for offset in offsets:
+            cell_x = x + offset[0]
+            cell_y = y + offset[1]
+            position = (cell_x >> CHUNK_SHIFT, cell_y >> CHUNK_SHIFT)
+            chunk = chunks.get(position) or self.chunk(position)
+            if chunk is None:
+                continue
+            index = chunk.cells[((cell_y & CHUNK_MASK) << CHUNK_SHIFT) | (cell_x & CHUNK_MASK)]
+            if index >= 0 and chunk.rects[index] not in around:
+                around.append(chunk.rects[index])
+
+        return around
+
+    def sweep(self, x, y, width, height, dx, dy):
+        """Find when a moving box first hits a solid cell.
+
+        The leading edges of the box cross the grid lines in order of time,
+        like a ray walking a grid, and each crossing checks only the column
+        or row of cells the box enters. The cost grows with the distance in
+        cells, not with the speed. Cells overlapped at the start are not
+        checked, so a box stuck in a wall can get out of it.
+
+        Args:
+            x (float): The left of the box, in pixels.
+            y (float): The top of the box, in pixels.
+            width (int): The width of the box.
+            height (int): The height of the box.
+            dx (float): The motion on the x axis, in pixels.
+            dy (float): The motion on the y axis, in pixels.
+
+        Returns:
+            tuple: The time of impact, from 0 to 1 of the motion, and the
+            x and y of the normal of the face hit, (1, 0, 0) without hit.
+        """
+        tile_size = self.tilemap.tile_size
+        is_solid = self.is_solid
+        right = x + width
+        bottom = y + height
+
+        # Next column or row entered by the leading edge on each axis, when
+        # it is entered and the time between two of them
+        if dx > 0:
+            column = math.ceil(right / tile_size)
+            time_x = (column * tile_size - right) / dx
+            step_x = 1
+        elif dx < 0:
+            column = math.floor(x / tile_size) - 1
+            time_x = ((column + 1) * tile_size - x) / dx
+            step_x = -1
+        else:
+            time_x = math.inf
+        if dy > 0:
+            row = math.ceil(bottom / tile_size)
+            time_y = (row * tile_size - bottom) / dy
+            step_y = 1
+        elif dy < 0:
+            row = math.floor(y / tile_size) - 1
+            time_y = ((row + 1) * tile_size - y) / dy
+            step_y = -1
+        else:
+            time_y = math.inf
+        delta_x = tile_size / abs(dx) if dx else 0
+        delta_y = tile_size / abs(dy) if dy else 0
+
+        while True:
+            if time_x <= time_y:
+                if time_x > 1:
+                    return 1.0, 0, 0
+                # The rows overlapped when the column is entered, the trailing
+                # edge from the position and the leading one from the walk
+                top = y + dy * time_x
+                if dy > 0:
+                    first, last = int(top // tile_size), row - 1
+                elif dy < 0:
+                    first, last = row + 1, math.ceil((top + height) / tile_size) - 1
+                else:
+                    first, last = int(top // tile_size), math.ceil(bottom / tile_size) - 1
+                for cell_y in range(first, last + 1):
+                    if is_solid(column, cell_y):
+                        return time_x, -step_x, 0
+                column += step_x
+                time_x += delta_x
+            else:
+                if time_y > 1:
+                    return 1.0, 0, 0
+                left = x + dx * time_y
+                if dx > 0:
+                    first, last = int(left // tile_size), column - 1
+                elif dx < 0:
+                    first, last = column + 1, math.ceil((left + width) / tile_size) - 1
+                else:
+                    first, last = int(left // tile_size), math.ceil(right / tile_size) - 1
+                for cell_x in range(first, last + 1):
+                    if is_solid(cell_x, row):
+                        return time_y, 0, -step_y
+                row += step_y
+                time_y += delta_y
+
+    def move(self, x, y, width, height, dx, dy):
+        """Move a box, sliding along the solid cells it hits.
+
+        Each hit stops the motion on the axis of the face hit and the rest
+        of the motion goes on along the other axis, so a box is swept at
+        most three times.
+
+        Returns:
+            tuple: The new x and y of the box, and the x and y of the normals
+            of the faces hit, 0 on an axis without hit.
+        """
+        tile_size = self.tilemap.tile_size
+        normal_x = normal_y = 0
+        while dx or dy:
+            time, hit_x, hit_y = self.sweep(x, y, width, height, dx, dy)
+            x += dx * time
+            y += dy * time
+            if hit_x:
+                # Snaps to the grid line, the time of impact is not exact
+                x = round(x / tile_size) * tile_size if hit_x > 0 else round(
+                    (x + width) / tile_size) * tile_size - width
+                normal_x = hit_x
+                dx = 0
+            elif hit_y:
+                y = round(y / tile_size) * tile_size if hit_y > 0 else round(
+                    (y + height) / tile_size) * tile_size - height
+                normal_y = hit_y
+                dy = 0
+            else:
+                break
+            dx *= 1 - time
+            dy *= 1 - time
+
+        return x, y, normal_x, normal_y
@@ -1,17 +1,25 @@
 import pygame
 
+from libs.profiler import profiler
 from libs.tilemap import Tilemap
 
 ACTION_JUMP = "jump"
 ACTION_RUN = "run"
 ACTION_IDLE = "idle"
 
+GRAVITY = 0.1
+TERMINAL_VELOCITY = 5
+
+PROJECTILE_SPEED = 2.5
+SHOOT_COOLDOWN = 15
+
 
 class PhysicsEntity:
     def __init__(self, game, entity_type, position, size):
         self.game = game
         self.entity_type = entity_type
         self.position = list(position)
+        self.last_position = list(position)
         self.size = size
         self.velocity = [0, 0]
         self.collisions = {"up": False, "down": False,
@@ -23,64 +31,54 @@ class PhysicsEntity:
         self.set_action(ACTION_IDLE)
 
     def rect(self):
+        profiler.count("rect_allocations")
         return pygame.Rect(self.position[0], self.position[1], self.size[0], self.size[1])
 
     def set_action(self, action):
         if self.action != action:
             self.action = action
-            self.animation = self.game.assets[f"{
-                self.entity_type}/{self.action}"].copy()
+            self.animation = self.game.assets[f"{self.entity_type}/{self.action}"].copy()
 
-    def update(self, tilemap: Tilemap, movement=(0, 0)):
+    def update(self, tilemap: Tilemap, movement=(0, 0), dt=1.0):
         self.collisions = {"up": False, "down": False,
                            "left": False, "right": False}
-
-        frame_movement = (movement[0] + self.velocity[0],
-                          movement[1] + self.velocity[1])
-
-        # Collision detection on the x axis
-        self.position[0] += frame_movement[0]
-        entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.position):
-            if entity_rect.colliderect(rect):
-                if frame_movement[0] > 0:  # Moving right
-                    entity_rect.right = rect.left
-                    self.collisions["right"] = True
-                if frame_movement[0] < 0:  # Moving left
-                    entity_rect.left = rect.right
-                    self.collisions["left"] = True
-                self.position[0] = entity_rect.x
-
-        # Collision detection on the y axis
-        self.position[1] += frame_movement[1]
-        entity_rect = self.rect()
-        for rect in tilemap.physics_rects_around(self.position):
-            if entity_rect.colliderect(rect):
-                if frame_movement[1] > 0:
-                    entity_rect.bottom = rect.top
-                    self.collisions["down"] = True
-                if frame_movement[1] < 0:
-                    entity_rect.top = rect.bottom
-                    self.collisions["up"] = True
-                self.position[1] = entity_rect.y
+        self.last_position[0] = self.position[0]
+        self.last_position[1] = self.position[1]
+
+        # Velocities are in pixels per tick at the reference rate,
+        # dt is the length of this tick in reference ticks.
+        frame_movement = ((movement[0] + self.velocity[0]) * dt,
+                          (movement[1] + self.velocity[1]) * dt)
+
+        # Swept against the grid, so fast entities cannot go through walls
+        self.position[0], self.position[1], normal_x, normal_y = tilemap.collision.move(
+            self.position[0], self.position[1], self.size[0], self.size[1], frame_movement[0], frame_movement[1])
+        self.collisions["right"] = normal_x < 0
+        self.collisions["left"] = normal_x > 0
+        self.collisions["down"] = normal_y < 0
+        self.collisions["up"] = normal_y > 0
 
         if movement[0] > 0:
             self.flip = False
         if movement[0] < 0:
             self.flip = True
 
-        self.velocity[1] = min(5, self.velocity[1] + 0.1)
+        self.velocity[1] = min(TERMINAL_VELOCITY, self.velocity[1] + GRAVITY * dt)
 
         if self.collisions["down"] or self.collisions["up"]:
             self.velocity[1] = 0
 
-        self.animation.update()
+        self.animation.update(dt)
 
-    def render(self, surface, offset=(0, 0)):
+    def render(self, surface, offset=(0, 0), alpha=1.0):
+        # alpha interpolates between the last two simulated positions
+        position = (self.last_position[0] + (self.position[0] - self.last_position[0]) * alpha,
+                    self.last_position[1] + (self.position[1] - self.last_position[1]) * alpha)
+        profiler.count("blits")
         surface.blit(
-            pygame.transform.flip(self.animation.image(), self.flip, False),
-            (self.position[0] - offset[0] + self.animation_offset[0],
-             self.position[1] - offset[1] + self.animation_offset[1])
+            self.animation.image(self.flip),
+            (position[0] - offset[0] + self.animation_offset[0],
+             position[1] - offset[1] + self.animation_offset[1])
         )
 
 
@@ -88,11 +86,13 @@ class Player(PhysicsEntity):
     def __init__(self, game, position, size):
         super().__init__(game, "player", position, size)
         self.air_time = 0
+        self.shoot_cooldown = 0
 
-    def update(self, tilemap: Tilemap, movement=(0, 0)):
-        super().update(tilemap, movement=movement)
+    def update(self, tilemap: Tilemap, movement=(0, 0), dt=1.0):
+        super().update(tilemap, movement=movement, dt=dt)
 
-        self.air_time += 1
+        self.air_time += dt
+        self.shoot_cooldown = max(0, self.shoot_cooldown - dt)
         if self.collisions["down"]:
             self.air_time = 0
 
@@ -102,3 +102,37 @@ class Player(PhysicsEntity):
             self.set_action(ACTION_RUN)
         else:
             self.set_action(ACTION_IDLE)
+
+    def shoot(self, projectiles):
+        """Fire a projectile in front of the player, unless the gun is cooling down.
+
+        Args:
+            projectiles (ProjectileManager): The projectiles of the game.
+
+        Returns:
+            bool: True if a projectile was fired.
+        """
+        if self.shoot_cooldown > 0:
+            return False
+        rect = self.rect()
+        if self.flip:
+            projectiles.spawn((rect.left - 7, rect.centery), -PROJECTILE_SPEED)
+        else:
+            projectiles.spawn((rect.right + 7, rect.centery), PROJECTILE_SPEED)
+        self.shoot_cooldown = SHOOT_COOLDOWN
+
+        return True
+
+    def render(self, surface, offset=(0, 0), alpha=1.0):
+        super().render(surface, offset=offset, alpha=alpha)
+
+        position = (self.last_position[0] + (self.position[0] - self.last_position[0]) * alpha,
+                    self.last_position[1] + (self.position[1] - self.last_position[1]) * alpha)
+        center_y = position[1] + self.size[1] / 2
+        profiler.count("blits")
+        if self.flip:
+            gun = self.game.assets["gun/flipped"]
+            surface.blit(gun, (position[0] - 4 - gun.get_width() - offset[0], center_y - offset[1]))
+        else:
+            gun = self.game.assets["gun"]
+            surface.blit(gun, (position[0] + self.size[0] + 4 - offset[0], center_y - offset[1]))
@@ -0,0 +1,197 @@
+import random
+from array import array
+
+import pygame
+
+from libs.entities import ACTION_IDLE, ACTION_RUN, GRAVITY, TERMINAL_VELOCITY
+from libs.navigation import MOVE_JUMP, MOVE_LEFT
+from libs.profiler import profiler
+from libs.spatial import SpatialHash
+
+ALIVE = 1
+COLLIDE_UP = 2
+COLLIDE_DOWN = 4
+COLLIDE_LEFT = 8
+COLLIDE_RIGHT = 16
+FLIP = 32
+RUNNING = 64
+CHASING = 128
+
+ENEMY_SPEED = 0.5
+ENEMY_JUMP = -3
+
+
+class EntityManager:
+    """Enemies stored as columns of numbers instead of one object each.
+
+    Positions, velocities, sizes and flags of every entity live in flat
+    arrays indexed by a slot number. Physics and AI run in a single pass
+    over the columns, without per-entity objects or dicts, and dead slots
+    are recycled by later spawns. The rectangles of the living entities are
+    kept in a spatial hash, for overlap queries.
+    """
+
+    def __init__(self, game, entity_type="enemy", seed=None):
+        self.game = game
+        self.entity_type = entity_type
+        self.random = random.Random(seed)
+
+        self.x = array("d")
+        self.y = array("d")
+        self.last_x = array("d")
+        self.last_y = array("d")
+        self.velocity_x = array("d")
+        self.velocity_y = array("d")
+        self.width = array("i")
+        self.height = array("i")
+        self.flags = array("B")
+        self.walking = array("d")
+        self.frame = array("d")
+        self.free = []
+        self.count = 0
+        self.index = SpatialHash()
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, position, size=(8, 15)):
+        """Add an entity and get its slot.
+
+        Args:
+            position (tuple): The top left position of the entity, in pixels.
+            size (tuple): The size of the entity, in pixels.
+
+        Returns:
+            int: The slot of the entity in the columns.
+        """
+        values = (position[0], position[1], position[0], position[1], 0, 0,
+                  size[0], size[1], ALIVE, 0, 0)
+        columns = (self.x, self.y, self.last_x, self.last_y, self.velocity_x, self.velocity_y,
+                   self.width, self.height, self.flags, self.walking, self.frame)
+        if self.free:
+            index = self.free.pop()
+            for column, value in zip(columns, values):
+                column[index] = value
+        else:
+            index = len(self.x)
+            for column, value in zip(columns, values):
+                column.append(value)
+        self.count += 1
+        self.index.insert(index, (int(position[0]), int(position[1]), size[0], size[1]))
+
+        return index
+
+    def kill(self, index):
+        if self.flags[index] & ALIVE:
+            self.flags[index] = 0
+            self.free.append(index)
+            self.count -= 1
+            self.index.remove(index)
+
+    def alive(self):
+        return [index for index, flags in enumerate(self.flags) if flags & ALIVE]
+
+    def rect(self, index):
+        profiler.count("rect_allocations")
+        return pygame.Rect(self.x[index], self.y[index], self.width[index], self.height[index])
+
+    def query(self, rect):
+        """Get the slots of the living entities overlapping an area."""
+        return self.index.query(rect)
+
+    def update(self, tilemap, dt=1.0, flow_field=None):
+        """Step the AI and physics of every entity.
+
+        Args:
+            tilemap (Tilemap): The map the entities move in.
+            dt (float): The length of the tick, in reference ticks.
+            flow_field (FlowField): The way to the player, entities on it chase the player.
+        """
+        x, y, velocity_x, velocity_y = self.x, self.y, self.velocity_x, self.velocity_y
+        width, height, flags, walking = self.width, self.height, self.flags, self.walking
+        is_solid = tilemap.collision.is_solid
+        move_box = tilemap.collision.move
+        tile_size = tilemap.tile_size
+        rng = self.random
+
+        for i in range(len(x)):
+            entity_flags = flags[i]
+            if not entity_flags & ALIVE:
+                continue
+            self.last_x[i] = x[i]
+            self.last_y[i] = y[i]
+
+            # Follow the flow field when it reaches the entity, keeping the
+            # direction while jumping or falling. Otherwise walk for a while,
+            # turning around at walls and ledges.
+            movement = 0
+            move = 0
+            if flow_field is not None:
+                move = flow_field.move(int((x[i] + width[i] / 2) // tile_size),
+                                       int((y[i] + height[i] - 1) // tile_size))
+            chasing = CHASING if move or (entity_flags & CHASING and not entity_flags & COLLIDE_DOWN) else 0
+            if chasing:
+                if move:
+                    entity_flags = entity_flags | FLIP if move & MOVE_LEFT else entity_flags & ~FLIP
+                    if move & MOVE_JUMP and entity_flags & COLLIDE_DOWN:
+                        velocity_y[i] = ENEMY_JUMP
+                movement = -ENEMY_SPEED if entity_flags & FLIP else ENEMY_SPEED
+            elif walking[i] > 0:
+                ahead = x[i] + width[i] / 2 + (-7 if entity_flags & FLIP else 7)
+                if is_solid(int(ahead // tile_size), int((y[i] + 23) // tile_size)):
+                    if entity_flags & (COLLIDE_LEFT | COLLIDE_RIGHT):
+                        entity_flags ^= FLIP
+                    else:
+                        movement = -ENEMY_SPEED if entity_flags & FLIP else ENEMY_SPEED
+                else:
+                    entity_flags ^= FLIP
+                walking[i] = max(0, walking[i] - dt)
+            elif rng.random() < 0.01 * dt:
+                walking[i] = rng.randint(30, 120)
+
+            was_running = entity_flags & RUNNING
+            entity_flags = entity_flags & (ALIVE | FLIP) | chasing
+            w = width[i]
+            h = height[i]
+
+            # Same swept resolution as PhysicsEntity.update
+            x[i], y[i], normal_x, normal_y = move_box(
+                x[i], y[i], w, h, (movement + velocity_x[i]) * dt, velocity_y[i] * dt)
+            if normal_x:
+                entity_flags |= COLLIDE_RIGHT if normal_x < 0 else COLLIDE_LEFT
+            if normal_y:
+                entity_flags |= COLLIDE_DOWN if normal_y < 0 else COLLIDE_UP
+
+            if entity_flags & (COLLIDE_UP | COLLIDE_DOWN):
+                velocity_y[i] = 0
+            else:
+                velocity_y[i] = min(TERMINAL_VELOCITY, velocity_y[i] + GRAVITY * dt)
+
+            if movement:
+                entity_flags |= RUNNING
+            if entity_flags & RUNNING != was_running:
+                self.frame[i] = 0
+            else:
+                self.frame[i] += dt
+            flags[i] = entity_flags
+            self.index.move(i, (int(x[i]), int(y[i]), w, h))
+
+    def render(self, surface, offset=(0, 0), alpha=1.0):
+        idle = self.game.assets[f"{self.entity_type}/{ACTION_IDLE}"]
+        run = self.game.assets[f"{self.entity_type}/{ACTION_RUN}"]
+        view = pygame.Rect(offset, surface.get_size()).inflate(32, 32)
+
+        for i in range(len(self.x)):
+            entity_flags = self.flags[i]
+            if not entity_flags & ALIVE:
+                continue
+            x = self.last_x[i] + (self.x[i] - self.last_x[i]) * alpha
+            y = self.last_y[i] + (self.y[i] - self.last_y[i]) * alpha
+            if not view.collidepoint(x, y):
+                continue
+            animation = run if entity_flags & RUNNING else idle
+            images = animation.flipped_images if entity_flags & FLIP else animation.images
+            profiler.count("blits")
+            surface.blit(
+                images[int(self.frame[i] / animation.image_duration) % len(images)],
+                (x - offset[0] - 3, y - offset[1] - 3))
@@ -0,0 +1,139 @@
+import os
+import random
+
+import pygame
+
+from libs.entities import Player
+from libs.tilemap import Tilemap
+from libs.utils import ASSETS_IMAGE, Animation, load_images
+
+TILE_TYPES = ["decor", "grass", "large_decor", "spawners", "stone"]
+PLAYER_ACTIONS = ["idle", "run", "jump", "slide", "wall_slide"]
+ENEMY_ACTIONS = ["idle", "run"]
+
+
+def use_dummy_drivers():
+    """Make pygame run without a window nor a sound card."""
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+
+def placeholder_images(path, size):
+    """Create blank images standing in for the images of a folder.
+
+    Only the folder listing is read, so it works without decoding any image.
+
+    Args:
+        path (str): The path to the images folder, in assets/images.
+        size (tuple): The size of the blank images.
+
+    Returns:
+        list: One blank image per image in the folder.
+    """
+    images = []
+    for _ in sorted(os.listdir(ASSETS_IMAGE + path)):
+        image = pygame.Surface(size)
+        image.fill((255, 255, 255))
+        image.set_colorkey((0, 0, 0))
+        images.append(image)
+
+    return images
+
+
+def headless_assets(real_images=False, tile_size=16):
+    """Build the assets needed to simulate and render without a display.
+
+    Args:
+        real_images (bool): Decode the real images instead of using blank ones.
+        tile_size (int): The size of the blank tile images.
+
+    Returns:
+        dict: The assets, with the same keys as Game.assets.
+    """
+    if real_images:
+        images = load_images
+    else:
+        def images(path):
+            return placeholder_images(path, (tile_size, tile_size))
+
+    assets = {tile_type: images("tiles/" + tile_type) for tile_type in TILE_TYPES}
+    durations = {"idle": 6, "run": 4}
+    for action in PLAYER_ACTIONS:
+        assets["player/" + action] = Animation(
+            images("entities/player/" + action), image_duration=durations.get(action, 5))
+    for action in ENEMY_ACTIONS:
+        assets["enemy/" + action] = Animation(
+            images("entities/enemy/" + action), image_duration=durations.get(action, 5))
+
+    return assets
+
+
+def generate_map(width, height, seed=0, tile_size=16):
+    """Generate a map with hilly ground, floating platforms and decor.
+
+    Args:
+        width (int): The width of the map, in tiles.
+        height (int): The height of the map, in tiles.
+        seed (int): The seed of the random generator.
+        tile_size (int): The size of a tile, in pixels.
+
+    Returns:
+        dict: The map, in the same format as map.json.
+    """
+    rng = random.Random(seed)
+    tiles = {}
+
+    def place(tile_type, x, y):
+        tiles[f"{x};{y}"] = {"type": tile_type, "variant": 0, "pos": [x, y]}
+
+    ground = height * 2 // 3
+    for x in range(width):
+        ground = max(height // 3, min(height - 2, ground + rng.choice([-1, 0, 0, 1])))
+        place("grass", x, ground)
+        for y in range(ground + 1, height):
+            place("stone" if y > ground + 2 else "grass", x, y)
+        if rng.random() < 0.1:
+            tiles[f"{x};{ground - 1}"] = {
+                "type": "decor", "variant": rng.randrange(4), "pos": [x, ground - 1]}
+
+    for _ in range(width // 8):
+        x = rng.randrange(width)
+        y = rng.randrange(2, height // 3)
+        for offset in range(rng.randint(2, 6)):
+            place("grass", x + offset, y)
+
+    offgrid = [{
+        "type": "large_decor",
+        "variant": rng.randrange(3),
+        "pos": [rng.random() * width * tile_size, rng.random() * height * tile_size]}
+        for _ in range(width // 4)]
+
+    return {"tilemap": tiles, "tile_size": tile_size, "offgrid": offgrid}
+
+
+class HeadlessGame:
+    """Game state that can be simulated without a window.
+
+    It exposes the same `assets` as Game so entities and the tilemap work
+    unchanged, and steps the player with no frame cap.
+    """
+
+    def __init__(self, map_data=None, map_path=None, real_images=False):
+        use_dummy_drivers()
+        self.assets = headless_assets(real_images=real_images)
+        self.tilemap = Tilemap(self, tile_size=16)
+        if map_path is not None:
+            self.tilemap.load(map_path)
+        elif map_data is not None:
+            self.tilemap.load_data(map_data)
+
+        self.player = Player(self, (50, 50), (8, 15))
+        self.ticks = 0
+
+    def tick(self, movement=(0, 0), dt=1.0):
+        self.player.update(self.tilemap, movement, dt=dt)
+        self.ticks += 1
+
+    def run(self, ticks, movement=(0, 0)):
+        for _ in range(ticks):
+            self.tick(movement)
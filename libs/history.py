@@ -0,0 +1,178 @@
+import collections
+import struct
+
+# x, y, type index + 1 and variant before, then after, 0 meaning empty
+CELL_CHANGE = struct.Struct("<iiBBBB")
+# Rough size of an off-grid tile, to bound the memory of the history
+OFFGRID_SIZE = 64
+
+HISTORY_BYTES = 4 << 20
+HISTORY_ENTRIES = 500
+
+
+class Edit:
+    """The changes of one undoable edit, while it is being made.
+
+    Cells are touched before they are modified, which saves their content
+    the first time only. When the edit ends, only the cells whose content
+    really changed are kept.
+    """
+
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.before = {}
+        # [key, tile] pairs, the key changing each time the tile is added again
+        self.offgrid_added = []
+        self.offgrid_removed = []
+
+    def touch(self, x, y):
+        if (x, y) not in self.before:
+            tile = self.tilemap.tilemap.get(x, y)
+            self.before[(x, y)] = None if tile is None else (tile["type"], tile["variant"])
+
+
+class History:
+    """Undo and redo of tilemap edits, stored as compact diffs.
+
+    Each entry packs its cell changes in CELL_CHANGE records, with the
+    off-grid tiles it added and removed. The oldest entries are dropped
+    when the history holds more than `max_entries` entries or about
+    `max_bytes` bytes.
+    """
+
+    def __init__(self, tilemap, max_bytes=HISTORY_BYTES, max_entries=HISTORY_ENTRIES):
+        self.tilemap = tilemap
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.undo_entries = collections.deque()
+        self.redo_entries = []
+        self.size = 0
+        self.types = []
+        self.type_indexes = {}
+        self.edit = None
+        # [key, tile] of the off-grid tiles in the map, shared by the entries
+        # holding them so their key stays right when a tile is added again
+        self.offgrid_items = {}
+
+    def begin(self):
+        """Start an edit, or continue the one in progress, like a paint stroke."""
+        if self.edit is None:
+            self.edit = Edit(self.tilemap)
+
+        return self.edit
+
+    def touch(self, x, y):
+        self.begin().touch(x, y)
+
+    def set_tile(self, x, y, state):
+        """Change a cell as part of the current edit.
+
+        Args:
+            x (int): The cell x coordinate.
+            y (int): The cell y coordinate.
+            state (tuple): The (type, variant) to write, or None to empty the cell.
+        """
+        self.touch(x, y)
+        self.write(x, y, state)
+
+    def add_offgrid(self, tile):
+        key = self.tilemap.add_offgrid(tile)
+        item = self.offgrid_items[key] = [key, tile]
+        self.begin().offgrid_added.append(item)
+
+        return key
+
+    def remove_offgrid(self, key):
+        tile = self.tilemap.remove_offgrid(key)
+        if tile is not None:
+            item = self.offgrid_items.pop(key, None) or [key, tile]
+            edit = self.begin()
+            # A tile added by this edit is simply forgotten
+            if item in edit.offgrid_added:
+                edit.offgrid_added.remove(item)
+            else:
+                edit.offgrid_removed.append(item)
+
+        return tile
+
+    def end(self):
+        """Close the current edit and add it to the history, if it changed anything."""
+        edit = self.edit
+        self.edit = None
+        if edit is None:
+            return
+
+        changes = bytearray()
+        for (x, y), before in edit.before.items():
+            tile = self.tilemap.tilemap.get(x, y)
+            after = None if tile is None else (tile["type"], tile["variant"])
+            if after != before:
+                changes += CELL_CHANGE.pack(x, y, *self.pack_state(before), *self.pack_state(after))
+        if not changes and not edit.offgrid_added and not edit.offgrid_removed:
+            return
+
+        entry = (bytes(changes), edit.offgrid_added, edit.offgrid_removed)
+        self.undo_entries.append(entry)
+        self.size += self.entry_size(entry)
+        self.redo_entries = []
+        while self.undo_entries and (len(self.undo_entries) > self.max_entries or self.size > self.max_bytes):
+            self.size -= self.entry_size(self.undo_entries.popleft())
+
+    def undo(self):
+        self.end()
+        if not self.undo_entries:
+            return False
+        entry = self.undo_entries.pop()
+        self.size -= self.entry_size(entry)
+        self.apply(entry, undo=True)
+        self.redo_entries.append(entry)
+
+        return True
+
+    def redo(self):
+        self.end()
+        if not self.redo_entries:
+            return False
+        entry = self.redo_entries.pop()
+        self.apply(entry, undo=False)
+        self.undo_entries.append(entry)
+        self.size += self.entry_size(entry)
+
+        return True
+
+    def apply(self, entry, undo):
+        changes, added, removed = entry
+        for x, y, before_type, before_variant, after_type, after_variant in CELL_CHANGE.iter_unpack(changes):
+            if undo:
+                self.write(x, y, self.unpack_state(before_type, before_variant))
+            else:
+                self.write(x, y, self.unpack_state(after_type, after_variant))
+
+        for item in added if undo else removed:
+            self.tilemap.remove_offgrid(item[0])
+            self.offgrid_items.pop(item[0], None)
+        for item in removed if undo else added:
+            item[0] = self.tilemap.add_offgrid(item[1])
+            self.offgrid_items[item[0]] = item
+
+    def write(self, x, y, state):
+        if state is None:
+            self.tilemap.remove_tile(x, y)
+        else:
+            self.tilemap.set_tile({"type": state[0], "variant": state[1], "pos": [x, y]})
+
+    def pack_state(self, state):
+        if state is None:
+            return 0, 0
+        index = self.type_indexes.get(state[0])
+        if index is None:
+            index = self.type_indexes[state[0]] = len(self.types)
+            self.types.append(state[0])
+
+        return index + 1, state[1]
+
+    def unpack_state(self, tile_type, variant):
+        return None if tile_type == 0 else (self.types[tile_type - 1], variant)
+
+    def entry_size(self, entry):
+        return len(entry[0]) + (len(entry[1]) + len(entry[2])) * OFFGRID_SIZE
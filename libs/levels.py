@@ -0,0 +1,142 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from libs.mapformat import MAP_EXTENSION
+from libs.tilemap import Tilemap
+
+LEVELS_DIR = "assets/maps/"
+COMPILED_DIR = "build/maps/"
+SPAWNERS = [("spawners", 0), ("spawners", 1)]
+TREES = [("large_decor", 2)]
+BAKES_PER_TICK = 4
+
+
+def compiled_path(path, compiled_dir=COMPILED_DIR):
+    """Get the compiled version of a map, if it is not older than the map itself.
+
+    Args:
+        path (str): The path of a JSON map.
+        compiled_dir (str): Where compile_maps.py writes the compiled maps.
+
+    Returns:
+        str: The path of the compiled map, or the given path if it is missing or stale.
+    """
+    compiled = os.path.join(compiled_dir, os.path.splitext(os.path.basename(path))[0] + MAP_EXTENSION)
+    try:
+        if os.path.getmtime(compiled) >= os.path.getmtime(path):
+            return compiled
+    except OSError:
+        pass
+
+    return path
+
+
+def level_paths(directory=LEVELS_DIR, compiled_dir=COMPILED_DIR):
+    """List the levels of a folder, in order: 0.json, 1.json, ... 10.json.
+
+    Levels compiled by compile_maps.py are used instead of their JSON source.
+    """
+    names = [name for name in os.listdir(directory) if name.endswith(".json")]
+    names.sort(key=lambda name: (0, int(name[:-5])) if name[:-5].isdigit() else (1, name))
+
+    return [compiled_path(os.path.join(directory, name), compiled_dir) for name in names]
+
+
+class Level:
+    """A level ready to be played: its tilemap and what was taken out of it."""
+
+    def __init__(self, path, tilemap, spawners, trees):
+        self.path = path
+        self.tilemap = tilemap
+        self.spawners = spawners
+        self.trees = trees
+        self.unbaked = list(tilemap.tilemap.chunks)
+
+    def bake(self, count=None):
+        """Bake the surfaces of chunks not baked yet, on the main thread.
+
+        Args:
+            count (int): The most chunks to bake, all of them by default.
+
+        Returns:
+            int: The number of chunks baked.
+        """
+        chunks = self.tilemap.tilemap.chunks
+        baked = 0
+        while self.unbaked and (count is None or baked < count):
+            position = self.unbaked.pop()
+            if position in chunks:
+                self.tilemap.render_cache.bake(chunks[position])
+                baked += 1
+
+        return baked
+
+
+class LevelManager:
+    """Loads levels on a worker thread, ahead of the time they are played.
+
+    A level is parsed and its collision data built on the worker, while the
+    current one plays. Pygame surfaces are not thread safe, so its chunks
+    are baked on the main thread, a few per tick once it is loaded, and
+    the rest when it is swapped in. Asking for a level that is not ready
+    yet waits for it, which only happens for the first one.
+    """
+
+    def __init__(self, game, paths, tile_size=16):
+        self.game = game
+        self.paths = paths
+        self.tile_size = tile_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="levels")
+        self.futures = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def build(self, path):
+        tilemap = Tilemap(self.game, tile_size=self.tile_size)
+        try:
+            tilemap.load(path)
+        except FileNotFoundError:
+            pass
+        spawners = tilemap.extract(SPAWNERS)
+        trees = tilemap.extract(TREES, keep=True)
+
+        # Unpacks the rectangles of compiled maps, and merges again the
+        # chunks the spawners were taken out of
+        tilemap.collision.build_all()
+
+        return Level(path, tilemap, spawners, trees)
+
+    def prepare(self, index):
+        """Start loading a level in the background, if it exists and is not loading yet."""
+        if 0 <= index < len(self.paths) and index not in self.futures:
+            self.futures[index] = self.executor.submit(self.build, self.paths[index])
+
+    def load(self, index):
+        """Get a level, waiting for it if it is still loading.
+
+        The level is handed over only once: it is played, then changed, so
+        playing it again loads it again.
+
+        Args:
+            index (int): The index of the level in the paths.
+
+        Returns:
+            Level: The loaded level.
+        """
+        self.prepare(index)
+        level = self.futures.pop(index).result()
+        level.bake()
+
+        return level
+
+    def update(self, budget=BAKES_PER_TICK):
+        """Bake a few chunks of the levels loaded in the background."""
+        for future in self.futures.values():
+            if budget <= 0:
+                break
+            if future.done() and future.exception() is None:
+                budget -= future.result().bake(budget)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,234 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+
+from libs.chunks import CHUNK_AREA, CHUNK_SHIFT, TileChunk, chunk_index
+from libs.utils import atomic_write
+
+MAGIC = b"NJMP"
+VERSION = 1
+
+# magic, version, tile size, chunk size, type count, chunk count, offgrid count
+HEADER = struct.Struct("<4sHHHHII")
+# chunk x, chunk y, tile count, record offset
+CHUNK_ENTRY = struct.Struct("<iiHI")
+# type index, variant, x, y
+OFFGRID_ENTRY = struct.Struct("<BBdd")
+# Each cell of a chunk record is (type index + 1, variant), 0 meaning empty
+CHUNK_RECORD_SIZE = CHUNK_AREA * 2
+# Optional section of compiled maps: magic, chunk count
+COLLISION_MAGIC = b"NJCL"
+COLLISION_HEADER = struct.Struct("<4sI")
+# chunk x, chunk y, mask of the solid cells, rectangle count
+COLLISION_ENTRY = struct.Struct("<iiQB")
+# left, top, width, height, in cells from the origin of the chunk
+COLLISION_RECT = struct.Struct("<BBBB")
+
+MAP_EXTENSION = ".map"
+
+
+def is_binary_map(filename):
+    with open(filename, "rb") as file_content:
+        return file_content.read(len(MAGIC)) == MAGIC
+
+
+def encode_chunk(chunk, type_indexes):
+    """Pack the tiles of a chunk into a fixed-size record.
+
+    Args:
+        chunk (TileChunk): The chunk to pack.
+        type_indexes (dict): The index of each tile type in the type table.
+
+    Returns:
+        bytearray: The record, CHUNK_RECORD_SIZE bytes long.
+    """
+    record = bytearray(CHUNK_RECORD_SIZE)
+    for index, tile in enumerate(chunk.tiles):
+        if tile is not None:
+            record[index * 2] = type_indexes[tile["type"]] + 1
+            record[index * 2 + 1] = tile["variant"]
+
+    return record
+
+
+def encode_map(chunks, tile_size, offgrid_tiles, collision=None):
+    """Build the binary form of a map.
+
+    The file holds a header, the table of tile types, an index of the
+    chunks and one fixed-size record per chunk, then the off-grid tiles.
+    Fixed-size records let a chunk be decoded, or rewritten, on its own.
+    Compiled maps end with the merged collision rectangles of the chunks.
+
+    Args:
+        chunks (list): The TileChunk objects of the map.
+        tile_size (int): The size of a tile, in pixels.
+        offgrid_tiles (list): The off-grid tiles of the map.
+        collision (list): (position, mask, rects) of each chunk, from
+            CollisionGrid.export, None to leave them out.
+
+    Returns:
+        bytearray: The content of the file.
+    """
+    types = sorted({tile["type"] for chunk in chunks for tile in chunk.tiles if tile is not None}
+                   | {tile["type"] for tile in offgrid_tiles})
+    if len(types) > 255:
+        raise ValueError("A map can not hold more than 255 tile types")
+    type_indexes = {tile_type: index for index, tile_type in enumerate(types)}
+
+    data = bytearray(HEADER.pack(
+        MAGIC, VERSION, tile_size, 1 << CHUNK_SHIFT, len(types), len(chunks), len(offgrid_tiles)))
+    for tile_type in types:
+        name = tile_type.encode("utf-8")
+        data += bytes([len(name)]) + name
+
+    records_start = len(data) + CHUNK_ENTRY.size * len(chunks)
+    for number, chunk in enumerate(chunks):
+        data += CHUNK_ENTRY.pack(
+            chunk.position[0], chunk.position[1], chunk.count,
+            records_start + number * CHUNK_RECORD_SIZE)
+    for chunk in chunks:
+        data += encode_chunk(chunk, type_indexes)
+
+    for tile in offgrid_tiles:
+        data += OFFGRID_ENTRY.pack(
+            type_indexes[tile["type"]], tile["variant"], tile["pos"][0], tile["pos"][1])
+
+    if collision is not None:
+        data += COLLISION_HEADER.pack(COLLISION_MAGIC, len(collision))
+        for position, mask, rects in collision:
+            data += COLLISION_ENTRY.pack(position[0], position[1], mask, len(rects))
+            for rect in rects:
+                data += COLLISION_RECT.pack(*rect)
+
+    return data
+
+
+class MapFile:
+    """A binary map file, memory-mapped and decoded one chunk at a time.
+
+    Opening it only reads the header, the type table, the chunk index, the
+    off-grid tiles and the collision rectangles, if any. It can be attached
+    to a ChunkedTileStore, which decodes the chunks the first time they are
+    needed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file_content:
+            self.data = mmap.mmap(file_content.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.tile_size, chunk_size, type_count, chunk_count, offgrid_count = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a binary map")
+        if version != VERSION or chunk_size != 1 << CHUNK_SHIFT:
+            raise ValueError(f"{filename} uses an unsupported map format")
+
+        offset = HEADER.size
+        self.types = []
+        for _ in range(type_count):
+            length = self.data[offset]
+            self.types.append(self.data[offset + 1:offset + 1 + length].decode("utf-8"))
+            offset += 1 + length
+
+        self.counts = {}
+        self.offsets = {}
+        self.entries = {}
+        for _ in range(chunk_count):
+            x, y, count, record = CHUNK_ENTRY.unpack_from(self.data, offset)
+            self.counts[(x, y)] = count
+            self.offsets[(x, y)] = record
+            self.entries[(x, y)] = offset
+            offset += CHUNK_ENTRY.size
+
+        offset += chunk_count * CHUNK_RECORD_SIZE
+        self.offgrid_tiles = []
+        for _ in range(offgrid_count):
+            type_index, variant, x, y = OFFGRID_ENTRY.unpack_from(self.data, offset)
+            self.offgrid_tiles.append({"type": self.types[type_index], "variant": variant, "pos": [x, y]})
+            offset += OFFGRID_ENTRY.size
+
+        self.collision = {}
+        if self.data[offset:offset + len(COLLISION_MAGIC)] == COLLISION_MAGIC:
+            _, collision_count = COLLISION_HEADER.unpack_from(self.data, offset)
+            offset += COLLISION_HEADER.size
+            for _ in range(collision_count):
+                x, y, mask, rect_count = COLLISION_ENTRY.unpack_from(self.data, offset)
+                offset += COLLISION_ENTRY.size
+                rects = [COLLISION_RECT.unpack_from(self.data, offset + number * COLLISION_RECT.size)
+                         for number in range(rect_count)]
+                offset += rect_count * COLLISION_RECT.size
+                self.collision[(x, y)] = (mask, rects)
+
+    def read_chunk(self, position):
+        chunk = TileChunk(position)
+        origin = chunk.origin()
+        record = self.offsets[position]
+        for index in range(CHUNK_AREA):
+            type_index = self.data[record + index * 2]
+            if type_index:
+                chunk.tiles[index] = {
+                    "type": self.types[type_index - 1],
+                    "variant": self.data[record + index * 2 + 1],
+                    "pos": [origin[0] + (index & ((1 << CHUNK_SHIFT) - 1)), origin[1] + (index >> CHUNK_SHIFT)]}
+                chunk.count += 1
+
+        return chunk
+
+    def close(self):
+        if not self.data.closed:
+            self.data.close()
+
+
+def chunks_from_json(tiles):
+    chunks = {}
+    for tile in tiles.values():
+        x, y = int(tile["pos"][0]), int(tile["pos"][1])
+        position = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT)
+        if position not in chunks:
+            chunks[position] = TileChunk(position)
+        chunks[position].tiles[chunk_index(x, y)] = tile
+        chunks[position].count += 1
+
+    return [chunks[position] for position in sorted(chunks)]
+
+
+def convert(source, destination=None):
+    """Convert a JSON map, like map.json, to the binary format.
+
+    Args:
+        source (str): The path of the JSON map.
+        destination (str): The path of the binary map, next to the source by default.
+
+    Returns:
+        str: The path of the binary map.
+    """
+    if destination is None:
+        destination = os.path.splitext(source)[0] + MAP_EXTENSION
+    with open(source, "r") as file_content:
+        map_data = json.load(file_content)
+
+    atomic_write(destination, encode_map(
+        chunks_from_json(map_data["tilemap"]), map_data["tile_size"], map_data["offgrid"]))
+
+    return destination
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert JSON maps to the binary map format.")
+    parser.add_argument("maps", nargs="+", help="JSON maps, like map.json or assets/maps/0.json")
+    parser.add_argument("--output-dir", help="where to write the binary maps, next to the sources by default")
+    args = parser.parse_args()
+
+    for source in args.maps:
+        destination = None
+        if args.output_dir:
+            name = os.path.splitext(os.path.basename(source))[0] + MAP_EXTENSION
+            destination = os.path.join(args.output_dir, name)
+        print(f"{source} -> {convert(source, destination)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+from collections import deque
+
+from libs.chunks import CHUNK_SHIFT
+
+NAV_WIDTH = 48
+NAV_HEIGHT = 32
+JUMP_HEIGHT = 2
+JUMP_REACH = 2
+
+MOVE_LEFT = 1
+MOVE_RIGHT = 2
+MOVE_JUMP = 4
+
+
+class FlowField:
+    """The way toward a target for every cell around it, shared by all chasers.
+
+    The graph covers a window of cells around the target. Its nodes are the
+    cells an entity can stand in, an empty cell above a solid one, linked
+    by walking to the next cell, falling off a ledge or jumping up to
+    JUMP_HEIGHT cells. The graph is kept as the window moves by a chunk
+    and the map changes: only the nodes entering the window, the ones whose
+    edges depended on its old bounds and the ones around changed cells get
+    their edges again.
+
+    When the target enters another cell, or the graph changed, a
+    breadth-first search from the target gives each node its first move,
+    which chasers read in constant time. The search only visits the nodes
+    reaching the target and costs far less than building the graph, and
+    a goal move changes the distance of most nodes anyway, so repairing
+    the distances instead would not be cheaper.
+    """
+
+    def __init__(self, tilemap, width=NAV_WIDTH, height=NAV_HEIGHT):
+        self.tilemap = tilemap
+        self.width = width
+        self.height = height
+        self.origin = None
+        self.version = None
+        self.goal = None
+        # Solid cells of the window, with one more row for the floor under the last one
+        self.solid = bytearray()
+        # Edges by node, in absolute cells, as (cell, move) pairs
+        self.successors = {}
+        self.predecessors = {}
+        # Nodes whose edges depend on the bounds of the window
+        self.border = set()
+        self.linked = False
+        self.moves = {}
+
+    def update(self, position):
+        """Follow the target, recomputing the field if it changed cell or the graph changed.
+
+        Args:
+            position (tuple): The feet of the target, in pixels.
+        """
+        tile_size = self.tilemap.tile_size
+        x = int(position[0] // tile_size)
+        y = int(position[1] // tile_size)
+        origin = (((x - self.width // 2) >> CHUNK_SHIFT) << CHUNK_SHIFT,
+                  ((y - self.height // 2) >> CHUNK_SHIFT) << CHUNK_SHIFT)
+        if origin != self.origin:
+            self.move_window(origin)
+        if self.tilemap.version != self.version:
+            self.refresh()
+
+        goal = self.ground(x, y)
+        if goal != self.goal or self.linked:
+            self.goal = goal
+            self.linked = False
+            self.flow()
+
+    def move(self, x, y):
+        """Get the MOVE_* bits leading from a cell to the target, 0 if there is no way."""
+        return self.moves.get((x, y), 0)
+
+    def is_solid(self, x, y):
+        x -= self.origin[0]
+        y -= self.origin[1]
+        return self.solid[y * self.width + x] if 0 <= x < self.width and 0 <= y <= self.height else 0
+
+    def is_standing(self, x, y):
+        return 0 <= y - self.origin[1] < self.height and not self.is_solid(x, y) and self.is_solid(x, y + 1)
+
+    def ground(self, x, y):
+        """Get the cell where an entity at a cell lands, None if outside of the window."""
+        while self.inside(x, y) and not self.is_solid(x, y):
+            if self.is_solid(x, y + 1):
+                return (x, y)
+            y += 1
+        return None
+
+    def inside(self, x, y):
+        return 0 <= x - self.origin[0] < self.width and 0 <= y - self.origin[1] < self.height
+
+    def near_bounds(self, x, y):
+        """Check if the edges of a node can read cells out of the window."""
+        x -= self.origin[0]
+        y -= self.origin[1]
+        return (x <= JUMP_REACH or x >= self.width - 1 - JUMP_REACH
+                or y <= JUMP_HEIGHT or y >= self.height - 1)
+
+    def move_window(self, origin):
+        previous, previous_solid = self.origin, self.solid
+        width, height = self.width, self.height
+        self.origin = origin
+        if previous is None:
+            self.version = self.tilemap.version
+
+        # Cells still in the window are kept, even if they changed since:
+        # refresh compares them to the map when its version changed
+        is_solid = self.tilemap.collision.is_solid
+        self.solid = bytearray(width * (height + 1))
+        entering = []
+        for y in range(height + 1):
+            for x in range(width):
+                cell_x = origin[0] + x
+                cell_y = origin[1] + y
+                kept = previous is not None and 0 <= cell_x - previous[0] < width
+                if kept and 0 <= cell_y - previous[1] <= height:
+                    self.solid[y * width + x] = previous_solid[(cell_y - previous[1]) * width + cell_x - previous[0]]
+                else:
+                    self.solid[y * width + x] = is_solid(cell_x, cell_y)
+                # The floor row of the previous window had no nodes
+                if y < height and not (kept and 0 <= cell_y - previous[1] < height):
+                    entering.append((cell_x, cell_y))
+
+        # Nodes out of the window are removed, and nodes near its new bounds
+        # linked again, like those whose edges depended on the old bounds
+        nodes = [cell for cell in self.successors if not self.inside(*cell) or self.near_bounds(*cell)]
+        self.link(entering + sorted(nodes) + sorted(self.border))
+
+    def refresh(self):
+        """Find the solid cells that changed in the window and link the nodes around them again."""
+        self.version = self.tilemap.version
+        is_solid = self.tilemap.collision.is_solid
+        width, height = self.width, self.height
+        left, top = self.origin
+        cells = set()
+        for y in range(height + 1):
+            for x in range(width):
+                solid = is_solid(left + x, top + y)
+                if solid == self.solid[y * width + x]:
+                    continue
+                self.solid[y * width + x] = solid
+                cell_x, cell_y = left + x, top + y
+                # The nodes whose edges or standing read the cell: jumps
+                # and walks near it, and falls through it from above
+                for node_y in range(cell_y - 1, cell_y + JUMP_HEIGHT + 1):
+                    for node_x in range(cell_x - JUMP_REACH, cell_x + JUMP_REACH + 1):
+                        cells.add((node_x, node_y))
+                for node_y in range(top, cell_y + 1):
+                    cells.add((cell_x - 1, node_y))
+                    cells.add((cell_x + 1, node_y))
+
+        self.link(sorted(cells))
+
+    def link(self, cells):
+        """Compute the edges of cells again, adding and removing nodes as needed."""
+        successors, predecessors = self.successors, self.predecessors
+        pending = list(cells)
+        while pending:
+            cell = pending.pop()
+            standing = self.is_standing(*cell)
+            if not standing and cell not in successors:
+                continue
+            self.linked = True
+            for target, move in successors.pop(cell, ()):
+                if target in predecessors:
+                    predecessors[target].remove((cell, move))
+            self.border.discard(cell)
+
+            if not standing:
+                # Its predecessors must drop their edges to it
+                pending.extend(source for source, _ in predecessors.pop(cell))
+                continue
+
+            edges, border = self.edges(*cell)
+            successors[cell] = edges
+            predecessors.setdefault(cell, [])
+            for target, move in edges:
+                predecessors.setdefault(target, []).append((cell, move))
+            if border:
+                self.border.add(cell)
+
+    def edges(self, x, y):
+        """Get the edges leaving a node, and if they depend on the bounds of the window."""
+        top = self.origin[1]
+        border = self.near_bounds(x, y)
+        edges = []
+        for direction, move in ((-1, MOVE_LEFT), (1, MOVE_RIGHT)):
+            # Walk to the next cell, or fall off the ledge
+            target = self.ground(x + direction, y)
+            if target is not None:
+                edges.append((target, move))
+            elif not self.is_solid(x + direction, y):
+                border = True
+
+            for rise in range(1, JUMP_HEIGHT + 1):
+                if y - rise < top or self.is_solid(x, y - rise):
+                    break
+                for reach in range(1, JUMP_REACH + 1):
+                    if self.is_solid(x + direction * reach, y - rise):
+                        break
+                    if self.is_standing(x + direction * reach, y - rise):
+                        edges.append(((x + direction * reach, y - rise), move | MOVE_JUMP))
+
+        return edges, border
+
+    def flow(self):
+        self.moves = {}
+        if self.goal is None:
+            return
+        reached = {self.goal}
+        queue = deque([self.goal])
+        while queue:
+            target = queue.popleft()
+            for source, move in self.predecessors.get(target, ()):
+                if source not in reached:
+                    reached.add(source)
+                    self.moves[source] = move
+                    queue.append(source)
@@ -0,0 +1,99 @@
+from array import array
+
+import pygame
+
+from libs.profiler import profiler
+
+
+class ParallaxLayer:
+    """Images scrolling together at one depth, pre-rendered into a strip.
+
+    The layer repeats every `period` pixels, the view size plus a margin
+    letting images leave the view before they wrap. It is drawn once into a
+    strip two periods wide and one period high, so any scroll position is
+    covered by one window of the strip, split in at most two blits where
+    it wraps vertically.
+    """
+
+    def __init__(self, items, depth=1.0, margin=None):
+        """Create a layer, its strip is drawn on the first render.
+
+        Args:
+            items (list): (image, (x, y)) pairs, positions being fractions
+                of the period in [0, 1).
+            depth (float): How much the layer follows the camera, 0 for a
+                fixed background, 1 to move with the tiles.
+            margin (tuple): The size added to the view to get the period,
+                the size of the largest image by default.
+        """
+        self.items = items
+        self.depth = depth
+        if margin is None:
+            margin = (max((image.get_width() for image, _ in items), default=0),
+                      max((image.get_height() for image, _ in items), default=0))
+        self.margin = margin
+        self.view_size = None
+        self.period = None
+        self.strip = None
+
+    def bake(self, view_size):
+        self.view_size = view_size
+        self.period = (view_size[0] + self.margin[0], view_size[1] + self.margin[1])
+        width, height = self.period
+        self.strip = pygame.Surface((width * 2, height))
+        self.strip.set_colorkey((0, 0, 0))
+        for image, position in self.items:
+            x = int(position[0] * width)
+            y = int(position[1] * height)
+            # Copies on every side that can show up inside the strip
+            for copy_x in (x - width, x, x + width):
+                for copy_y in (y - height, y):
+                    self.strip.blit(image, (copy_x, copy_y))
+
+    def render(self, surface, offset=(0, 0), drift=(0, 0)):
+        if surface.get_size() != self.view_size:
+            self.bake(surface.get_size())
+        width, height = self.period
+        left = int(self.margin[0] - drift[0] + offset[0] * self.depth) % width
+        top = int(self.margin[1] - drift[1] + offset[1] * self.depth) % height
+
+        view_width, view_height = self.view_size
+        first = min(view_height, height - top)
+        profiler.count("blits")
+        surface.blit(self.strip, (0, 0), (left, top, view_width, first))
+        if first < view_height:
+            profiler.count("blits")
+            surface.blit(self.strip, (0, first), (left, 0, view_width, view_height - first))
+
+
+class Parallax:
+    """A stack of parallax layers, drawn back to front.
+
+    The drifts of the layers are kept in one array updated in place, and
+    a layer costs the same whatever the number of images it holds.
+    """
+
+    def __init__(self):
+        self.layers = []
+        self.speeds = array("d")
+        self.drifts = array("d")
+
+    def add_layer(self, layer, speed=0.0):
+        """Add a layer in front of the others.
+
+        Args:
+            layer (ParallaxLayer): The layer, drawn over the previous ones.
+            speed (float): The horizontal drift of the layer, in pixels per tick.
+        """
+        self.layers.append(layer)
+        self.speeds.append(speed)
+        self.drifts.append(0.0)
+
+    def update(self, dt=1.0):
+        drifts, speeds = self.drifts, self.speeds
+        for index in range(len(drifts)):
+            drifts[index] += speeds[index] * dt
+
+    def render(self, surface, offset=(0, 0)):
+        for layer, drift in zip(self.layers, self.drifts):
+            layer.render(surface, offset=offset, drift=(drift, 0))
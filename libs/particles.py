@@ -0,0 +1,176 @@
+import math
+import random
+from array import array
+from itertools import compress, repeat
+from operator import add, ge, mul
+
+import pygame
+
+from libs.profiler import profiler
+
+PARTICLE_CAPACITY = 4096
+
+
+class ParticleSystem:
+    """A fixed pool of particles stored as columns of numbers.
+
+    A particle only stores where it would be at the time 0 without swaying,
+    its velocity and when it dies: its position and its image at any time
+    come from the clock and the per-tick tables of its kind, holding the
+    animation frames and the sway. Updating moves the clock and drops the
+    dead particles, replaced by the last live ones so the live particles
+    stay packed: it runs as built-in maps over the columns, without a
+    Python loop per particle. Drawing computes the positions the same way
+    and only loops over the particles inside the view.
+    """
+
+    def __init__(self, capacity=PARTICLE_CAPACITY):
+        self.capacity = capacity
+        self.x = array("d", bytes(8 * capacity))
+        self.y = array("d", bytes(8 * capacity))
+        self.velocity_x = array("d", bytes(8 * capacity))
+        self.velocity_y = array("d", bytes(8 * capacity))
+        self.death = array("d", bytes(8 * capacity))
+        # Index of the first tick of the kind in the tables, minus the birth
+        self.base = array("d", bytes(8 * capacity))
+        self.count = 0
+        self.time = 0.0
+
+        self.kinds = {}
+        self.starts = []
+        self.lengths = []
+        # Image and offset from the particle to the top left of the image,
+        # for each tick of each kind
+        self.images = []
+        self.offsets_x = []
+        self.offsets_y = []
+
+    def __len__(self):
+        return self.count
+
+    def register(self, name, animation, sway=0.0):
+        """Add a kind of particle.
+
+        Args:
+            name (str): The name used to spawn particles of this kind.
+            animation (Animation): The frames played by the particles.
+            sway (float): How far the particles swing from side to side, in pixels per tick.
+        """
+        self.kinds[name] = len(self.starts)
+        self.starts.append(len(self.images))
+        self.lengths.append(len(animation.images) * animation.image_duration)
+        swing = 0.0
+        for image in animation.images:
+            for _ in range(animation.image_duration):
+                self.images.append(image)
+                self.offsets_x.append(swing - image.get_width() // 2)
+                self.offsets_y.append(-(image.get_height() // 2))
+                swing += math.sin((len(self.images) - self.starts[-1]) * 0.035) * sway
+
+    def spawn(self, name, position, velocity=(0, 0), frame=0):
+        """Add a particle, centered on a position.
+
+        Returns:
+            bool: False if the pool is full and the particle was dropped.
+        """
+        if self.count >= self.capacity:
+            return False
+        kind = self.kinds[name]
+        start = self.starts[kind]
+        index = self.count
+        # Back to the time 0, without the sway of the frames already played
+        swing = self.offsets_x[start + frame] + self.images[start + frame].get_width() // 2
+        self.x[index] = position[0] - velocity[0] * self.time - swing
+        self.y[index] = position[1] - velocity[1] * self.time
+        self.velocity_x[index] = velocity[0]
+        self.velocity_y[index] = velocity[1]
+        self.death[index] = self.time - frame + self.lengths[kind]
+        self.base[index] = start - self.time + frame
+        self.count += 1
+
+        return True
+
+    def clear(self):
+        self.count = 0
+
+    def update(self, dt=1.0):
+        self.time += dt
+        count = self.count
+        dead = list(compress(range(count), map(ge, repeat(self.time, count), self.death)))
+        if not dead:
+            return
+
+        columns = (self.x, self.y, self.velocity_x, self.velocity_y, self.death, self.base)
+        # From the end, so the last particle moved in a hole is always alive
+        for index in reversed(dead):
+            count -= 1
+            for column in columns:
+                column[index] = column[count]
+        self.count = count
+
+    def render(self, surface, offset=(0, 0)):
+        """Draw the particles inside the view, in a single batched blit."""
+        count = self.count
+        if not count:
+            return
+        # Particle images are small and sway by a few pixels, a margin of
+        # 16 pixels keeps them until they are out of view
+        view = surface.get_rect().inflate(32, 32).move(offset)
+        time = self.time
+        x = list(map(add, self.x, map(mul, self.velocity_x, repeat(time, count))))
+        y = list(map(add, self.y, map(mul, self.velocity_y, repeat(time, count))))
+
+        images, offsets_x, offsets_y, base = self.images, self.offsets_x, self.offsets_y, self.base
+        offset_x, offset_y = offset
+        batch = []
+        for index in compress(range(count), map(view.collidepoint, x, y)):
+            tick = int(time + base[index])
+            batch.append((images[tick], (x[index] + offsets_x[tick] - offset_x, y[index] + offsets_y[tick] - offset_y)))
+
+        if batch:
+            profiler.count("blits", len(batch))
+            if hasattr(surface, "fblits"):
+                surface.fblits(batch)
+            else:
+                surface.blits(batch, doreturn=False)
+
+
+class Emitter:
+    """Spawns particles at random in areas of the map, like the foliage of trees.
+
+    Only the areas near the view emit, the particles of the others would
+    never be seen.
+    """
+
+    def __init__(self, particles, name, rects, rate=1 / 49999, velocity=(0, 0), frames=0):
+        """Create an emitter for some areas of the map.
+
+        Args:
+            particles (ParticleSystem): The system receiving the particles.
+            name (str): The kind of particle spawned.
+            rects (list): The emitting areas, in pixels.
+            rate (float): The particles spawned per pixel of area and per tick.
+            velocity (tuple): The initial velocity of the particles.
+            frames (int): The particles start at a random frame up to this one.
+        """
+        self.particles = particles
+        self.name = name
+        self.rects = [pygame.Rect(rect) for rect in rects]
+        self.rate = rate
+        self.velocity = velocity
+        self.frames = frames
+
+    def update(self, view, dt=1.0):
+        """Spawn particles in the areas touching the view.
+
+        Args:
+            view (pygame.Rect): The visible area of the map, in pixels.
+            dt (float): The elapsed time, in ticks.
+        """
+        for index in view.collidelistall(self.rects):
+            rect = self.rects[index]
+            if random.random() < rect.width * rect.height * self.rate * dt:
+                self.particles.spawn(
+                    self.name,
+                    (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height),
+                    self.velocity, random.randint(0, self.frames))
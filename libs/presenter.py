@@ -0,0 +1,79 @@
+import pygame
+
+
+class Presenter:
+    """Window showing a low resolution display surface, scaled up.
+
+    The display is scaled by the largest integer factor fitting the window
+    and centered in it. Scaling writes straight into the window surface, so
+    presenting a frame allocates nothing. With `scaled_mode`, pygame's SCALED
+    window does the scaling itself.
+
+    Regions marked dirty can be presented alone, so frames where little
+    changes only push those regions to the screen.
+    """
+
+    def __init__(self, caption, size=(320, 240), window_size=None, scaled_mode=False):
+        pygame.display.set_caption(caption)
+        self.size = size
+        self.scaled_mode = scaled_mode
+        self.dirty = []
+
+        if scaled_mode:
+            self.screen = pygame.display.set_mode(size, pygame.SCALED)
+            self.display = self.screen
+            self.scale = 1
+            self.area = self.screen.get_rect()
+            return
+
+        if window_size is None:
+            window_size = (size[0] * 2, size[1] * 2)
+        self.screen = pygame.display.set_mode(window_size)
+        self.display = pygame.Surface(size)
+        self.scale = max(1, min(window_size[0] // size[0], window_size[1] // size[1]))
+        self.area = pygame.Rect(0, 0, size[0] * self.scale, size[1] * self.scale)
+        self.area.center = self.screen.get_rect().center
+        self.target = self.screen.subsurface(self.area.clip(self.screen.get_rect()))
+
+    def to_display(self, position):
+        """Convert a window position, like the mouse position, to display pixels."""
+        if self.scaled_mode:
+            return position
+        return ((position[0] - self.area.x) / self.scale, (position[1] - self.area.y) / self.scale)
+
+    def mark_dirty(self, rect):
+        self.dirty.append(pygame.Rect(rect))
+
+    def present(self, full=True):
+        """Show the display in the window.
+
+        Args:
+            full (bool): Present the whole display, otherwise only the regions
+                marked dirty since the last call.
+        """
+        dirty = self.dirty
+        self.dirty = []
+        if self.scaled_mode:
+            if full:
+                pygame.display.flip()
+            elif dirty:
+                pygame.display.update(dirty)
+            return
+
+        if full:
+            pygame.transform.scale(self.display, self.target.get_size(), self.target)
+            pygame.display.update(self.area)
+            return
+
+        updated = []
+        bounds = self.display.get_rect()
+        for rect in dirty:
+            rect = rect.clip(bounds)
+            if not rect.width or not rect.height:
+                continue
+            scaled = pygame.Rect(rect.x * self.scale, rect.y * self.scale,
+                                 rect.width * self.scale, rect.height * self.scale)
+            pygame.transform.scale(self.display.subsurface(rect), scaled.size, self.target.subsurface(scaled))
+            updated.append(scaled.move(self.area.topleft))
+        if updated:
+            pygame.display.update(updated)
@@ -0,0 +1,167 @@
+import collections
+import contextlib
+import csv
+import json
+import os
+import threading
+import time
+
+import pygame
+
+PROFILE_ENV = "NINJA_PROFILE"
+HISTORY = 300
+HISTOGRAM_BUCKETS = [4, 8, 12, 16.7, 20, 33.3, 50]
+
+
+class Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        timings = self.profiler.timings
+        timings[self.name] = timings.get(self.name, 0) + time.perf_counter() - self.start
+
+
+class Profiler:
+    """Frame timings, named phase timers and counters, kept for the last frames.
+
+    When disabled, sections and counters cost a single attribute check, so
+    the instrumentation can stay in the hot paths. Only the main thread
+    counts, counts from workers would land in whatever frame is running.
+    """
+
+    def __init__(self, enabled=False, history=HISTORY):
+        self.enabled = enabled
+        self.thread = threading.main_thread().ident
+        self.timings = {}
+        self.counters = {}
+        self.frames = collections.deque(maxlen=history)
+        self.sections = {}
+        self.frame_start = None
+        self.font = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.frame_start = None
+        self.frames.clear()
+
+    def section(self, name):
+        """Time a phase of the frame.
+
+        Args:
+            name (str): The name of the phase, times add up within a frame.
+
+        Returns:
+            A context manager timing the code it wraps.
+        """
+        if not self.enabled:
+            return contextlib.nullcontext()
+        section = self.sections.get(name)
+        if section is None:
+            section = self.sections[name] = Section(self, name)
+
+        return section
+
+    def count(self, name, amount=1):
+        if self.enabled and threading.get_ident() == self.thread:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def end_frame(self):
+        """Close the current frame and start the next one."""
+        now = time.perf_counter()
+        if self.enabled and self.frame_start is not None:
+            self.frames.append({
+                "time": self.frame_start,
+                "frame_ms": (now - self.frame_start) * 1000,
+                "sections": {name: value * 1000 for name, value in self.timings.items()},
+                "counters": dict(self.counters),
+            })
+        self.frame_start = now
+        self.timings = {}
+        self.counters = {}
+
+    def histogram(self, buckets=HISTOGRAM_BUCKETS):
+        """Count the recorded frames by duration.
+
+        Args:
+            buckets (list): The upper bounds of the buckets, in milliseconds.
+
+        Returns:
+            list: The number of frames of each bucket, plus one for the slower ones.
+        """
+        counts = [0] * (len(buckets) + 1)
+        for frame in self.frames:
+            index = 0
+            while index < len(buckets) and frame["frame_ms"] > buckets[index]:
+                index += 1
+            counts[index] += 1
+
+        return counts
+
+    def summary(self):
+        if not self.frames:
+            return {}, {}
+        sections = {}
+        counters = {}
+        for frame in self.frames:
+            for name, value in frame["sections"].items():
+                sections[name] = sections.get(name, 0) + value
+            for name, value in frame["counters"].items():
+                counters[name] = counters.get(name, 0) + value
+
+        return ({name: value / len(self.frames) for name, value in sections.items()},
+                {name: value / len(self.frames) for name, value in counters.items()})
+
+    def render(self, surface):
+        if not self.enabled or not self.frames:
+            return
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, 12)
+
+        frame_times = [frame["frame_ms"] for frame in self.frames]
+        sections, counters = self.summary()
+        lines = [f"frame {sum(frame_times) / len(frame_times):.2f} ms  max {max(frame_times):.2f} ms"]
+        lines += [f"{name} {value:.2f} ms" for name, value in sections.items()]
+        lines += [f"{name} {value:.0f}" for name, value in counters.items()]
+        lines.append("hist " + " ".join(str(count) for count in self.histogram()))
+
+        for number, line in enumerate(lines):
+            surface.blit(self.font.render(line, False, (255, 255, 255), (0, 0, 0)),
+                         (surface.get_width() - 130, 2 + number * 9))
+
+        # Last frame times as bars, the line marks 60 FPS
+        bottom = surface.get_height() - 2
+        for number, frame_ms in enumerate(frame_times[-120:]):
+            height = min(40, int(frame_ms * 40 / 33.3))
+            color = (255, 80, 80) if frame_ms > 16.7 else (80, 255, 80)
+            pygame.draw.line(surface, color, (2 + number, bottom), (2 + number, bottom - height))
+        pygame.draw.line(surface, (255, 255, 255), (2, bottom - 20), (122, bottom - 20))
+
+    def export(self, path):
+        """Write the recorded frames to a CSV or JSON trace, by file extension."""
+        frames = list(self.frames)
+        if path.endswith(".csv"):
+            sections = sorted({name for frame in frames for name in frame["sections"]})
+            counters = sorted({name for frame in frames for name in frame["counters"]})
+            with open(path, "w", newline="") as file_content:
+                writer = csv.writer(file_content)
+                writer.writerow(["time", "frame_ms"] + [f"{name}_ms" for name in sections] + counters)
+                for frame in frames:
+                    writer.writerow(
+                        [f"{frame['time']:.6f}", f"{frame['frame_ms']:.3f}"]
+                        + [f"{frame['sections'].get(name, 0):.3f}" for name in sections]
+                        + [frame["counters"].get(name, 0) for name in counters])
+        else:
+            with open(path, "w") as file_content:
+                json.dump({"frames": frames, "histogram": {
+                    "buckets_ms": HISTOGRAM_BUCKETS, "counts": self.histogram()}}, file_content)
+
+
+profiler = Profiler(enabled=os.environ.get(PROFILE_ENV, "") not in ("", "0"))
@@ -0,0 +1,149 @@
+from array import array
+
+from libs.profiler import profiler
+
+PROJECTILE_CAPACITY = 512
+PROJECTILE_LIFETIME = 360
+
+OWNER_PLAYER = 0
+OWNER_ENEMY = 1
+
+
+class ProjectileManager:
+    """A fixed pool of projectiles stored as columns of numbers.
+
+    Live projectiles are packed at the start of the columns, a removed
+    projectile being replaced by the last live one. Projectiles stop on
+    solid tiles, and hits on entities are found through the spatial hash
+    of their targets, so each projectile only looks at the entities of its
+    own cell.
+    """
+
+    def __init__(self, image, capacity=PROJECTILE_CAPACITY, lifetime=PROJECTILE_LIFETIME):
+        self.image = image
+        self.capacity = capacity
+        self.lifetime = lifetime
+        self.x = array("d", bytes(8 * capacity))
+        self.y = array("d", bytes(8 * capacity))
+        self.velocity_x = array("d", bytes(8 * capacity))
+        self.timer = array("d", bytes(8 * capacity))
+        self.owner = array("B", bytes(capacity))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, position, velocity, owner=OWNER_PLAYER):
+        """Fire a projectile from a position.
+
+        Args:
+            position (tuple): The center of the projectile, in pixels.
+            velocity (float): The horizontal speed, in pixels per tick.
+            owner (int): Who fired it, OWNER_PLAYER or OWNER_ENEMY.
+
+        Returns:
+            bool: False if the pool is full and nothing was fired.
+        """
+        if self.count >= self.capacity:
+            return False
+        index = self.count
+        self.x[index] = position[0]
+        self.y[index] = position[1]
+        self.velocity_x[index] = velocity
+        self.timer[index] = 0
+        self.owner[index] = owner
+        self.count += 1
+
+        return True
+
+    def remove(self, index):
+        self.count -= 1
+        last = self.count
+        self.x[index] = self.x[last]
+        self.y[index] = self.y[last]
+        self.velocity_x[index] = self.velocity_x[last]
+        self.timer[index] = self.timer[last]
+        self.owner[index] = self.owner[last]
+
+    def clear(self):
+        self.count = 0
+
+    def update(self, tilemap, dt=1.0):
+        """Move the projectiles, removing the ones hitting a wall or too old.
+
+        Returns:
+            list: The positions where projectiles hit a wall.
+        """
+        x, y, velocity_x, timer = self.x, self.y, self.velocity_x, self.timer
+        is_solid = tilemap.collision.is_solid
+        tile_size = tilemap.tile_size
+
+        impacts = []
+        index = 0
+        while index < self.count:
+            # Every column crossed is checked, so fast projectiles hit thin walls
+            start = int(x[index] // tile_size)
+            x[index] += velocity_x[index] * dt
+            timer[index] += dt
+            end = int(x[index] // tile_size)
+            row = int(y[index] // tile_size)
+            step = 1 if end >= start else -1
+            hit = None
+            for column in range(start, end + step, step):
+                if is_solid(column, row):
+                    hit = column
+                    break
+            if hit is not None:
+                if hit != start:
+                    x[index] = (hit if step > 0 else hit + 1) * tile_size
+                impacts.append((x[index], y[index]))
+                self.remove(index)
+            elif timer[index] > self.lifetime:
+                self.remove(index)
+            else:
+                index += 1
+
+        return impacts
+
+    def hits(self, targets, owner=OWNER_PLAYER):
+        """Find the targets hit by projectiles, removing those projectiles.
+
+        Args:
+            targets (SpatialHash): The targets, by key.
+            owner (int): Only the projectiles fired by this owner can hit.
+
+        Returns:
+            list: (key, position) pairs for each hit.
+        """
+        x, y, projectile_owner = self.x, self.y, self.owner
+        query_point = targets.query_point
+
+        found = []
+        index = 0
+        while index < self.count:
+            if projectile_owner[index] == owner:
+                keys = query_point((x[index], y[index]))
+                if keys:
+                    found.append((min(keys), (x[index], y[index])))
+                    self.remove(index)
+                    continue
+            index += 1
+
+        return found
+
+    def render(self, surface, offset=(0, 0)):
+        width, height = surface.get_size()
+        image = self.image
+        center_x = image.get_width() // 2
+        center_y = image.get_height() // 2
+
+        batch = []
+        for index in range(self.count):
+            render_x = int(self.x[index]) - offset[0] - center_x
+            render_y = int(self.y[index]) - offset[1] - center_y
+            if -center_x * 2 < render_x < width and -center_y * 2 < render_y < height:
+                batch.append((image, (render_x, render_y)))
+
+        if batch:
+            profiler.count("blits", len(batch))
+            surface.blits(batch, doreturn=False)
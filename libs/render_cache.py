@@ -0,0 +1,71 @@
+import pygame
+
+from libs.chunks import CHUNK_SHIFT
+from libs.profiler import profiler
+
+
+class ChunkRenderCache:
+    """Pre-baked surfaces of the grid tiles, one per chunk.
+
+    Every chunk of the tilemap is drawn once into its own surface, which is
+    then reused each frame until one of its tiles changes. A baked surface
+    covers all the images of the chunk, even the ones bigger than a tile.
+    """
+
+    def __init__(self, tilemap):
+        self.tilemap = tilemap
+        self.surfaces = {}
+
+    def invalidate(self, position):
+        """Drop the baked surface of a chunk so it is drawn again.
+
+        Args:
+            position (tuple): The (x, y) coordinates of the chunk.
+        """
+        self.surfaces.pop(position, None)
+
+    def clear(self):
+        self.surfaces = {}
+
+    def bake(self, chunk):
+        assets = self.tilemap.game.assets
+        tile_size = self.tilemap.tile_size
+        images = []
+        bounds = None
+        for tile in chunk.tiles:
+            if tile is None:
+                continue
+            image = assets[tile["type"]][tile["variant"]]
+            rect = image.get_rect(
+                topleft=(tile["pos"][0] * tile_size, tile["pos"][1] * tile_size))
+            images.append((image, rect))
+            bounds = rect.copy() if bounds is None else bounds.union(rect)
+
+        surface = pygame.Surface(bounds.size)
+        surface.set_colorkey((0, 0, 0))
+        for image, rect in images:
+            surface.blit(image, (rect.x - bounds.x, rect.y - bounds.y))
+
+        profiler.count("chunk_bakes")
+        profiler.count("blits", len(images))
+        self.surfaces[chunk.position] = (surface, bounds)
+        return surface, bounds
+
+    def render(self, surface, offset=(0, 0)):
+        chunk_pixels = self.tilemap.tile_size << CHUNK_SHIFT
+        view = pygame.Rect(offset, surface.get_size())
+        store = self.tilemap.tilemap
+        # Start one chunk early, images bigger than a tile can spill over
+        # on the right and bottom of their own chunk.
+        for chunk_x in range(view.left // chunk_pixels - 1, view.right // chunk_pixels + 1):
+            for chunk_y in range(view.top // chunk_pixels - 1, view.bottom // chunk_pixels + 1):
+                chunk = store.chunk((chunk_x, chunk_y))
+                if chunk is None:
+                    continue
+                baked = self.surfaces.get(chunk.position)
+                if baked is None:
+                    baked = self.bake(chunk)
+                if view.colliderect(baked[1]):
+                    profiler.count("blits")
+                    surface.blit(
+                        baked[0], (baked[1].x - offset[0], baked[1].y - offset[1]))
@@ -0,0 +1,106 @@
+import hashlib
+import struct
+
+from libs.utils import atomic_write
+
+MAGIC = b"NJRP"
+VERSION = 1
+
+# magic, version, simulation rate, seed, tick count, state hash, level list length
+HEADER = struct.Struct("<4sHHII20sH")
+
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_SHOOT = 8
+
+REPLAY_EXTENSION = ".replay"
+
+
+def pack_input(movement, jump=False, shoot=False):
+    """Pack the input of a tick into one byte.
+
+    Args:
+        movement (list): The [left, right] keys held.
+        jump (bool): The jump key was pressed during the tick.
+        shoot (bool): The shoot key was pressed during the tick.
+
+    Returns:
+        int: The INPUT_* bits of the tick.
+    """
+    return ((INPUT_LEFT if movement[0] else 0) | (INPUT_RIGHT if movement[1] else 0)
+            | (INPUT_JUMP if jump else 0) | (INPUT_SHOOT if shoot else 0))
+
+
+def state_hash(game):
+    """Hash the simulated state of a game: the player, enemies and projectiles.
+
+    Floats are hashed by their exact bytes, so two runs only match if they
+    computed the very same values.
+
+    Returns:
+        bytes: The SHA-1 digest of the state.
+    """
+    digest = hashlib.sha1()
+    player = game.player
+    digest.update(struct.pack(
+        "<dddd", player.position[0], player.position[1], player.velocity[0], player.velocity[1]))
+
+    enemies = game.enemies
+    for column in (enemies.x, enemies.y, enemies.velocity_y, enemies.flags):
+        digest.update(column.tobytes())
+
+    projectiles = game.projectiles
+    digest.update(struct.pack("<I", projectiles.count))
+    for column in (projectiles.x, projectiles.y):
+        digest.update(column[:projectiles.count].tobytes())
+
+    return digest.digest()
+
+
+class InputRecorder:
+    """Records the input of every simulated tick, to replay a session later.
+
+    A replay is the header followed by one byte of INPUT_* bits per tick.
+    The header holds what the game needs to start in the same state: the
+    levels, the simulation rate and the seed of the enemies, and the hash
+    of the final state, checked at the end of a replay.
+    """
+
+    def __init__(self, path, levels, rate, seed):
+        self.path = path
+        self.levels = levels
+        self.rate = rate
+        self.seed = seed
+        self.inputs = bytearray()
+
+    def record(self, inputs):
+        self.inputs.append(inputs)
+
+    def save(self, final_hash):
+        name = ";".join(self.levels).encode("utf-8")
+        atomic_write(self.path, HEADER.pack(
+            MAGIC, VERSION, self.rate, self.seed, len(self.inputs), final_hash, len(name))
+            + name + self.inputs)
+
+
+class Replay:
+    """A recorded session, loaded from a file written by InputRecorder."""
+
+    def __init__(self, path):
+        with open(path, "rb") as file_content:
+            data = file_content.read()
+
+        magic, version, self.rate, self.seed, ticks, self.state_hash, name_length = \
+            HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a replay")
+        if version != VERSION:
+            raise ValueError(f"{path} uses an unsupported replay format")
+        self.levels = data[HEADER.size:HEADER.size + name_length].decode("utf-8").split(";")
+        self.inputs = data[HEADER.size + name_length:]
+        if len(self.inputs) != ticks:
+            raise ValueError(f"{path} is truncated")
+
+    def __len__(self):
+        return len(self.inputs)
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from libs.chunks import TileChunk
+from libs.mapformat import CHUNK_ENTRY, MAP_EXTENSION, MapFile, encode_chunk, encode_map
+from libs.utils import atomic_write, file_mode
+
+
+def snapshot_chunk(chunk):
+    copy = TileChunk(chunk.position)
+    copy.tiles = [None if tile is None else dict(tile) for tile in chunk.tiles]
+    copy.count = chunk.count
+
+    return copy
+
+
+def offgrid_key(offgrid):
+    return [(tile["type"], tile["variant"], tuple(tile["pos"])) for tile in offgrid]
+
+
+class MapSaver:
+    """Saves a tilemap on a worker thread, so the editor never freezes.
+
+    Saving copies the tiles on the calling thread, which is quick, then the
+    worker serializes the copy and writes it atomically. Binary maps whose
+    layout did not change since the last save only get their edited chunk
+    records rewritten: records have a fixed size, so the file is copied,
+    each record of the copy is a single small write, and the copy replaces
+    the file. Only the edited chunks are then copied and encoded, which
+    keeps saves of large maps cheap, see benchmark.py. A failed save is
+    kept in `error` until the caller reports it.
+    """
+
+    def __init__(self, tilemap, filename, autosave=0):
+        """Create a saver with its worker thread.
+
+        Args:
+            tilemap (Tilemap): The tilemap to save.
+            filename (str): The map file, binary if it ends with MAP_EXTENSION.
+            autosave (float): The seconds between two automatic saves of
+                changes, 0 to disable them.
+        """
+        self.tilemap = tilemap
+        self.filename = filename
+        self.autosave = autosave
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="saver")
+        self.future = None
+        self.error = None
+        self.saved_version = tilemap.version
+        self.last_save = time.monotonic()
+        # Layout of the binary file written by the last full save
+        self.layout = None
+
+    def changed(self):
+        return self.tilemap.version != self.saved_version
+
+    def poll(self):
+        """Check the save in progress, keeping its error in `error` if it failed."""
+        future = self.future
+        if future is None or not future.done():
+            return
+        self.future = None
+        error = future.exception()
+        if error is not None:
+            self.error = error
+            # The changes are not on disk, the next save writes the whole map
+            self.layout = None
+            self.saved_version = None
+
+    def save(self):
+        """Snapshot the map and write it in the background."""
+        self.poll()
+        tilemap = self.tilemap
+        store = tilemap.tilemap
+        store.load_all()
+        changed_chunks = tilemap.changed_chunks
+        tilemap.changed_chunks = set()
+        self.saved_version = tilemap.version
+        self.last_save = time.monotonic()
+
+        offgrid = [dict(tile) for tile in tilemap.offgrid_tiles.values()]
+        if self.filename.endswith(MAP_EXTENSION) and self.can_patch(changed_chunks, offgrid):
+            chunks = [snapshot_chunk(store.chunks[position])
+                      for position in sorted(changed_chunks) if position in store.chunks]
+            self.future = self.executor.submit(self.patch_binary, chunks)
+            return
+
+        chunks = [snapshot_chunk(store.chunks[position]) for position in sorted(store.chunks)]
+        self.future = self.executor.submit(self.write, chunks, tilemap.tile_size, offgrid)
+
+    def can_patch(self, changed_chunks, offgrid):
+        """Check if the chunks can be rewritten without changing the layout of the file."""
+        if self.layout is None or (self.future is not None and not self.future.done()):
+            return False
+        types, entries, saved_offgrid = self.layout
+        store = self.tilemap.tilemap
+        if set(store.chunks) != set(entries) or offgrid_key(offgrid) != saved_offgrid:
+            return False
+
+        return all(tile is None or tile["type"] in types
+                   for position in changed_chunks if position in store.chunks
+                   for tile in store.chunks[position].tiles)
+
+    def write(self, chunks, tile_size, offgrid):
+        if not self.filename.endswith(MAP_EXTENSION):
+            atomic_write(self.filename, json.dumps({
+                "tilemap": {f"{tile['pos'][0]};{tile['pos'][1]}": tile
+                            for chunk in chunks for tile in chunk.tiles if tile is not None},
+                "tile_size": tile_size,
+                "offgrid": offgrid
+            }))
+            return
+
+        self.layout = None
+        atomic_write(self.filename, encode_map(chunks, tile_size, offgrid))
+        map_file = MapFile(self.filename)
+        types = {tile_type: index for index, tile_type in enumerate(map_file.types)}
+        entries = {position: (map_file.entries[position], map_file.offsets[position])
+                   for position in map_file.offsets}
+        map_file.close()
+        self.layout = (types, entries, offgrid_key(offgrid))
+
+    def patch_binary(self, chunks):
+        types, entries, _ = self.layout
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.filename)),
+            prefix=os.path.basename(self.filename) + ".", suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "r+b") as file_content:
+                with open(self.filename, "rb") as source:
+                    shutil.copyfileobj(source, file_content)
+                for chunk in chunks:
+                    entry, record = entries[chunk.position]
+                    file_content.seek(entry)
+                    file_content.write(CHUNK_ENTRY.pack(chunk.position[0], chunk.position[1], chunk.count, record))
+                    file_content.seek(record)
+                    file_content.write(encode_chunk(chunk, types))
+                file_content.flush()
+                os.fsync(file_content.fileno())
+            os.chmod(temporary_path, file_mode(self.filename))
+            os.replace(temporary_path, self.filename)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+    def update(self):
+        """Check the save in progress, then autosave the changes if the interval elapsed."""
+        self.poll()
+        if self.autosave and self.changed() and time.monotonic() - self.last_save >= self.autosave:
+            self.save()
+
+    def wait(self):
+        """Wait for the save in progress, raising its error if it failed."""
+        if self.future is not None:
+            self.future.result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
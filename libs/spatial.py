@@ -0,0 +1,96 @@
+import pygame
+
+
+class SpatialHash:
+    """Uniform grid of buckets indexing rectangles by the cells they cover.
+
+    Keys are stored in every bucket their rectangle overlaps, so a query
+    only looks at the buckets under the queried area instead of every key.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rects = {}
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __contains__(self, key):
+        return key in self.rects
+
+    def cell_range(self, rect):
+        return (
+            int(rect[0] // self.cell_size), int(rect[1] // self.cell_size),
+            int((rect[0] + max(rect[2], 1) - 1) // self.cell_size),
+            int((rect[1] + max(rect[3], 1) - 1) // self.cell_size))
+
+    def insert(self, key, rect):
+        """Add a key to the index.
+
+        Args:
+            key (hashable): The key to store, unique in the index.
+            rect (pygame.Rect): The area covered by the key.
+        """
+        rect = pygame.Rect(rect)
+        self.rects[key] = rect
+        left, top, right, bottom = self.cell_range(rect)
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                bucket = self.cells.get((x, y))
+                if bucket is None:
+                    bucket = self.cells[(x, y)] = set()
+                bucket.add(key)
+
+    def remove(self, key):
+        rect = self.rects.pop(key, None)
+        if rect is None:
+            return
+        left, top, right, bottom = self.cell_range(rect)
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                bucket = self.cells[(x, y)]
+                bucket.discard(key)
+                if not bucket:
+                    del self.cells[(x, y)]
+
+    def move(self, key, rect):
+        old = self.rects.get(key)
+        if old is not None and self.cell_range(old) == self.cell_range(rect):
+            # Still in the same buckets, only the rectangle changes
+            self.rects[key] = pygame.Rect(rect)
+            return
+        self.remove(key)
+        self.insert(key, rect)
+
+    def clear(self):
+        self.cells = {}
+        self.rects = {}
+
+    def query(self, rect):
+        """Get the keys whose rectangle overlaps an area.
+
+        Args:
+            rect (pygame.Rect): The area to look into.
+
+        Returns:
+            set: The keys overlapping the area.
+        """
+        rect = pygame.Rect(rect)
+        found = set()
+        left, top, right, bottom = self.cell_range(rect)
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                bucket = self.cells.get((x, y))
+                if bucket:
+                    found.update(bucket)
+
+        return {key for key in found if self.rects[key].colliderect(rect)}
+
+    def query_point(self, point):
+        bucket = self.cells.get(
+            (int(point[0] // self.cell_size), int(point[1] // self.cell_size)))
+        if not bucket:
+            return set()
+
+        return {key for key in bucket if self.rects[key].collidepoint(point)}
@@ -2,6 +2,14 @@
 import json
 import pygame
 
+from libs.chunks import CHUNK_AREA, CHUNK_MASK, CHUNK_SHIFT, CHUNK_SIZE, ChunkedTileStore, chunk_position
+from libs.collision import CollisionGrid
+from libs.mapformat import MAP_EXTENSION, MapFile, encode_map, is_binary_map
+from libs.profiler import profiler
+from libs.render_cache import ChunkRenderCache
+from libs.spatial import SpatialHash
+from libs.utils import atomic_write
+
 AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1)])): 0,
     tuple(sorted([(1, 0), (0, 1), (-1, 0)])): 1,
@@ -14,88 +22,267 @@ AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (-1, 0), (0, 1), (0, -1)])): 8,
 }
 
+AUTOTILE_SHIFTS = [(1, 0), (0, -1), (-1, 0), (0, 1)]
+
+
+def autotile_variants():
+    """Turn AUTOTILE_MAP into a table indexed by a bitmask of neighbors.
+
+    Bit n of the index is set when the neighbor at AUTOTILE_SHIFTS[n] has
+    the same type as the tile.
+
+    Returns:
+        list: The variant for each of the 16 bitmasks, None if there is none.
+    """
+    variants = [None] * 16
+    for neighbors, variant in AUTOTILE_MAP.items():
+        # A key listing a neighbor twice can never match a set of neighbors
+        if len(set(neighbors)) == len(neighbors):
+            variants[sum(1 << AUTOTILE_SHIFTS.index(shift) for shift in neighbors)] = variant
+
+    return variants
+
+
+AUTOTILE_VARIANTS = autotile_variants()
+
+# Bulk autotiling works on chunks padded with a one cell border
+AUTOTILE_ROW = CHUNK_SIZE + 2
+AUTOTILE_CELLS = [((index >> CHUNK_SHIFT) + 1) * AUTOTILE_ROW + (index & CHUNK_MASK) + 1
+                  for index in range(CHUNK_AREA)]
+AUTOTILE_BORDER = [(x, y, (y + 1) * AUTOTILE_ROW + x + 1)
+                   for y in range(-1, CHUNK_SIZE + 1) for x in range(-1, CHUNK_SIZE + 1)
+                   if x in (-1, CHUNK_SIZE) or y in (-1, CHUNK_SIZE)]
+
 NEIGHBOR_OFFSETS = [
     (-1, 0), (-1, -1), (0, -1), (1, -1),
     (1, 0), (0, 0), (-1, 1), (0, 1), (1, 1)]
 PHYSICS_TILES = {"grass", "stone"}
 AUTOTILE_TILES = {"grass", "stone"}
+OFFGRID_CELL_SIZE = 64
 
 
 class Tilemap:
     def __init__(self, game, tile_size=16):
         self.game = game
         self.tile_size = tile_size
-        self.tilemap = {}
-        self.offgrid_tiles = []
+        self.tilemap = ChunkedTileStore()
+        self.offgrid_tiles = {}
+        self.offgrid_index = SpatialHash(OFFGRID_CELL_SIZE)
+        self.offgrid_serial = 0
+        self.render_cache = ChunkRenderCache(self)
+        self.collision = CollisionGrid(self, PHYSICS_TILES)
+        # Increased on every change, so views can tell when to redraw
+        self.version = 0
+        # Chunks edited since the last save, so savers can rewrite only them
+        self.changed_chunks = set()
 
     def tiles_around(self, position: list) -> list:
         tiles = []
         tile_location = (
             int(position[0] // self.tile_size), int(position[1] // self.tile_size))
         for offset in NEIGHBOR_OFFSETS:
-            check_location = f"{
-                tile_location[0] + offset[0]};{tile_location[1] + offset[1]}"
-            if check_location in self.tilemap:
-                tiles.append(self.tilemap[check_location])
+            tile = self.tilemap.get(
+                tile_location[0] + offset[0], tile_location[1] + offset[1])
+            if tile is not None:
+                tiles.append(tile)
 
         return tiles
 
+    def set_tile(self, tile):
+        x, y = int(tile["pos"][0]), int(tile["pos"][1])
+        self.tilemap.set(x, y, tile)
+        self.tile_changed(x, y)
+
+    def remove_tile(self, x, y):
+        tile = self.tilemap.remove(x, y)
+        if tile is not None:
+            self.tile_changed(x, y)
+
+        return tile
+
+    def tile_changed(self, x, y):
+        self.version += 1
+        self.changed_chunks.add(chunk_position(x, y))
+        self.render_cache.invalidate(chunk_position(x, y))
+        self.collision.invalidate(chunk_position(x, y))
+
+    def offgrid_rect(self, tile):
+        if self.game is not None and tile["type"] in self.game.assets:
+            size = self.game.assets[tile["type"]][tile["variant"]].get_size()
+        else:
+            size = (self.tile_size, self.tile_size)
+
+        return pygame.Rect(tile["pos"][0], tile["pos"][1], size[0], size[1])
+
+    def add_offgrid(self, tile):
+        key = self.offgrid_serial
+        self.offgrid_serial += 1
+        self.offgrid_tiles[key] = tile
+        self.offgrid_index.insert(key, self.offgrid_rect(tile))
+        self.version += 1
+
+        return key
+
+    def remove_offgrid(self, key):
+        self.offgrid_index.remove(key)
+        self.version += 1
+        return self.offgrid_tiles.pop(key, None)
+
+    def offgrid_in_rect(self, rect) -> list:
+        """Get the off-grid tiles overlapping an area, in drawing order.
+
+        Args:
+            rect (pygame.Rect): The area to look into, in pixels.
+
+        Returns:
+            list: The keys of the tiles in `offgrid_tiles`.
+        """
+        return sorted(self.offgrid_index.query(rect))
+
+    def offgrid_at(self, position) -> list:
+        return sorted(self.offgrid_index.query_point(position))
+
+    def extract(self, id_pairs, keep=False) -> list:
+        """Find the tiles of some types and variants, like spawners.
+
+        Args:
+            id_pairs (list): The (type, variant) pairs to look for.
+            keep (bool): Keep the tiles found in the map instead of removing them.
+
+        Returns:
+            list: Copies of the tiles found, with their position in pixels.
+        """
+        matches = []
+        for key, tile in list(self.offgrid_tiles.items()):
+            if (tile["type"], tile["variant"]) in id_pairs:
+                matches.append(tile.copy())
+                if not keep:
+                    self.remove_offgrid(key)
+
+        for tile in list(self.tilemap):
+            if (tile["type"], tile["variant"]) in id_pairs:
+                match = tile.copy()
+                match["pos"] = [tile["pos"][0] * self.tile_size, tile["pos"][1] * self.tile_size]
+                matches.append(match)
+                if not keep:
+                    self.remove_tile(tile["pos"][0], tile["pos"][1])
+
+        return matches
+
     def save(self, filename: str):
-        file_content = open(filename, "w")
-        json.dump({
-            "tilemap": self.tilemap,
+        if filename.endswith(MAP_EXTENSION):
+            self.tilemap.load_all()
+            atomic_write(filename, encode_map(
+                [self.tilemap.chunks[position] for position in sorted(self.tilemap.chunks)],
+                self.tile_size, list(self.offgrid_tiles.values())))
+            return
+
+        atomic_write(filename, json.dumps({
+            "tilemap": self.tilemap.to_json(),
             "tile_size": self.tile_size,
-            "offgrid": self.offgrid_tiles
-        }, file_content)
-        file_content.close()
+            "offgrid": list(self.offgrid_tiles.values())
+        }))
 
     def load(self, filename: str):
+        if is_binary_map(filename):
+            self.load_binary(MapFile(filename))
+            return
+
         file_content = open(filename, "r")
         map_data = json.load(file_content)
-        self.tilemap = map_data["tilemap"]
-        self.tile_size = map_data["tile_size"]
-        self.offgrid_tiles = map_data["offgrid"]
         file_content.close()
+        self.load_data(map_data)
+
+    def load_binary(self, map_file: MapFile):
+        """Load a binary map, its chunks are only decoded when first needed."""
+        self.tilemap.attach(map_file)
+        self.tile_size = map_file.tile_size
+        self.offgrid_tiles = {}
+        self.offgrid_index.clear()
+        for tile in map_file.offgrid_tiles:
+            self.add_offgrid(tile)
+        self.render_cache.clear()
+        self.collision.clear()
+        self.collision.load_compiled(map_file.collision)
+
+    def load_data(self, map_data: dict):
+        self.tilemap.load_json(map_data["tilemap"])
+        self.tile_size = map_data["tile_size"]
+        self.offgrid_tiles = {}
+        self.offgrid_index.clear()
+        for tile in map_data["offgrid"]:
+            self.add_offgrid(tile)
+        self.render_cache.clear()
+        self.collision.clear()
+        self.collision.build_all()
 
     def physics_rects_around(self, position: list) -> list:
-        rects = []
-        for tile in self.tiles_around(position):
-            if tile["type"] in PHYSICS_TILES:
-                rects.append(pygame.Rect(
-                    tile["pos"][0] * self.tile_size, tile["pos"][1] *
-                    self.tile_size,
-                    self.tile_size, self.tile_size
-                ))
+        profiler.count("physics_rects_around")
+        return self.collision.rects_around(
+            int(position[0] // self.tile_size), int(position[1] // self.tile_size), NEIGHBOR_OFFSETS)
 
-        return rects
+    def autotile_cell(self, x, y):
+        tile = self.tilemap.get(x, y)
+        if tile is None or tile["type"] not in AUTOTILE_TILES:
+            return
+        mask = 0
+        for bit, shift in enumerate(AUTOTILE_SHIFTS):
+            neighbor = self.tilemap.get(x + shift[0], y + shift[1])
+            if neighbor is not None and neighbor["type"] == tile["type"]:
+                mask |= 1 << bit
+
+        variant = AUTOTILE_VARIANTS[mask]
+        if variant is not None and tile["variant"] != variant:
+            tile["variant"] = variant
+            self.tile_changed(x, y)
+
+    def autotile_around(self, x, y):
+        """Autotile a cell and its 4 neighbors, after the cell was edited."""
+        self.autotile_cell(x, y)
+        for shift in AUTOTILE_SHIFTS:
+            self.autotile_cell(x + shift[0], y + shift[1])
 
     def autotile(self):
-        for location in self.tilemap:
-            tile = self.tilemap[location]
-            neighbors = set()
-            for shift in [(1, 0), (0, -1), (-1, 0), (0, 1)]:
-                check_location = f"{tile['pos'][0] +
-                                    shift[0]};{tile['pos'][1] + shift[1]}"
-                if check_location in self.tilemap:
-                    if self.tilemap[check_location]["type"] == tile["type"]:
-                        neighbors.add(shift)
-
-            neighbors = tuple(sorted(neighbors))
-            if tile["type"] in AUTOTILE_TILES and neighbors in AUTOTILE_MAP:
-                tile["variant"] = AUTOTILE_MAP[neighbors]
+        """Autotile the whole map, one chunk at a time.
+
+        For each tile type, the cells of a chunk and its border are turned
+        into one occupancy bitmask. Shifting it gives the tiles having a
+        neighbor of the same type in each direction, for all cells at once.
+        """
+        self.tilemap.load_all()
+        for chunk in list(self.tilemap.chunks.values()):
+            occupancy = {}
+            for index, tile in enumerate(chunk.tiles):
+                if tile is not None:
+                    occupancy[tile["type"]] = occupancy.get(tile["type"], 0) | 1 << AUTOTILE_CELLS[index]
+            if AUTOTILE_TILES.isdisjoint(occupancy):
+                continue
+
+            origin = chunk.origin()
+            for x, y, cell in AUTOTILE_BORDER:
+                tile = self.tilemap.get(origin[0] + x, origin[1] + y)
+                if tile is not None and tile["type"] in occupancy:
+                    occupancy[tile["type"]] |= 1 << cell
+
+            neighbors = {
+                tile_type: (mask >> 1, mask << AUTOTILE_ROW, mask << 1, mask >> AUTOTILE_ROW)
+                for tile_type, mask in occupancy.items() if tile_type in AUTOTILE_TILES}
+            for index, tile in enumerate(chunk.tiles):
+                if tile is None or tile["type"] not in neighbors:
+                    continue
+                right, up, left, down = neighbors[tile["type"]]
+                cell = AUTOTILE_CELLS[index]
+                variant = AUTOTILE_VARIANTS[
+                    (right >> cell & 1) | (up >> cell & 1) << 1 | (left >> cell & 1) << 2 | (down >> cell & 1) << 3]
+                if variant is not None and tile["variant"] != variant:
+                    tile["variant"] = variant
+                    self.tile_changed(tile["pos"][0], tile["pos"][1])
 
     def render(self, surface, offset=(0, 0)):
-        for tile in self.offgrid_tiles:
+        for key in self.offgrid_in_rect(pygame.Rect(offset, surface.get_size())):
+            tile = self.offgrid_tiles[key]
+            profiler.count("blits")
             surface.blit(
                 self.game.assets[tile["type"]][tile["variant"]], (tile["pos"][0] - offset[0], tile["pos"][1] - offset[1]))
 
-        for x in range(offset[0] // self.tile_size, (offset[0] + surface.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surface.get_height()) // self.tile_size + 1):
-                location = f"{x};{y}"
-                if location in self.tilemap:
-                    tile = self.tilemap[location]
-                    surface.blit(
-                        self.game.assets[tile["type"]][tile["variant"]],
-                        (tile["pos"][0] * self.tile_size - offset[0],
-                         tile["pos"][1] * self.tile_size - offset[1])
-                    )
+        self.render_cache.render(surface, offset=offset)
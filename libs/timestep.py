@@ -0,0 +1,46 @@
+REFERENCE_RATE = 60
+
+
+class FixedTimestep:
+    """Accumulator running the simulation at a fixed rate.
+
+    Elapsed real time is accumulated and consumed in steps of exactly
+    1 / rate seconds, whatever the frame rate is. The leftover time is
+    exposed as an interpolation factor for rendering.
+    """
+
+    def __init__(self, rate=REFERENCE_RATE, max_steps=8):
+        self.rate = rate
+        self.step = 1 / rate
+        self.max_steps = max_steps
+        self.accumulator = 0.0
+
+    def scale(self):
+        """Get the length of a step, in ticks of the reference rate.
+
+        Returns:
+            float: 1.0 when running at REFERENCE_RATE.
+        """
+        return REFERENCE_RATE / self.rate
+
+    def advance(self, elapsed):
+        """Add elapsed time and get the number of steps to simulate.
+
+        The number of steps is capped so a long stall does not make the
+        simulation fall further and further behind.
+
+        Args:
+            elapsed (float): The real time elapsed since the last call, in seconds.
+
+        Returns:
+            int: The number of steps to simulate.
+        """
+        self.accumulator = min(self.accumulator + elapsed, self.step * self.max_steps)
+        # The epsilon keeps float rounding from delaying a step by a frame
+        steps = int(self.accumulator / self.step + 1e-9)
+        self.accumulator = max(0.0, self.accumulator - steps * self.step)
+
+        return steps
+
+    def alpha(self):
+        return self.accumulator / self.step
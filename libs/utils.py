@@ -1,13 +1,22 @@
 import os
+import stat
+import tempfile
 import pygame
 
 ASSETS_IMAGE = "assets/images/"
 
+# The umask can only be read by setting it, which is done once, before saves
+# run on worker threads
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
 def load_image(path):
     """Load an image.
     Load an image from the assets/images folder
     And return it with the colorkey set to black (for transparency).
+    The image is only converted to the display format if a display exists,
+    so it can be loaded in headless mode.
 
     Args:
         path (str): The path to the image file.
@@ -15,7 +24,9 @@ def load_image(path):
     Returns:
         pygame.Surface: The image loaded.
     """
-    image = pygame.image.load(ASSETS_IMAGE + path).convert()
+    image = pygame.image.load(ASSETS_IMAGE + path)
+    if pygame.display.get_surface() is not None:
+        image = image.convert()
     image.set_colorkey((0, 0, 0))
 
     return image
@@ -38,24 +49,63 @@ def load_images(path):
 
     return images
 
+def file_mode(path):
+    """Get the permissions of a file, or the default ones if it does not exist."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+
+def atomic_write(path, data):
+    """Write a file atomically.
+    Write the data to a temporary file next to the destination
+    And rename it, so the file is never left half written.
+
+    Args:
+        path (str): The path to the file.
+        data (bytes | str): The content of the file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as file_content:
+            file_content.write(data.encode("utf-8") if isinstance(data, str) else data)
+            file_content.flush()
+            os.fsync(file_content.fileno())
+        # mkstemp makes the file private, keep the mode of the file replaced
+        os.chmod(temporary_path, file_mode(path))
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+
+
 class Animation:
-    def __init__(self, images, image_duration=5, loop=True):
+    def __init__(self, images, image_duration=5, loop=True, flipped_images=None):
         self.images = images
+        # Flipped frames are made once and shared by every copy
+        if flipped_images is None:
+            flipped_images = [pygame.transform.flip(image, True, False) for image in images]
+        self.flipped_images = flipped_images
         self.image_duration = image_duration
         self.loop = loop
         self.done = False
         self.frame = 0
 
     def copy(self):
-        return Animation(self.images, self.image_duration, self.loop)
+        return Animation(self.images, self.image_duration, self.loop, self.flipped_images)
 
-    def update(self):
+    def update(self, dt=1.0):
         if self.loop:
-            self.frame = (self.frame + 1) % (len(self.images) * self.image_duration)
+            self.frame = (self.frame + dt) % (len(self.images) * self.image_duration)
         else:
-            self.frame = min(self.frame + 1, len(self.images) * self.image_duration - 1)
+            self.frame = min(self.frame + dt, len(self.images) * self.image_duration - 1)
             if self.frame >= len(self.images) * self.image_duration - 1:
                 self.done = True
 
-    def image(self):
+    def image(self, flip=False):
+        if flip:
+            return self.flipped_images[int(self.frame / self.image_duration)]
         return self.images[int(self.frame / self.image_duration)]
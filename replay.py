@@ -0,0 +1,47 @@
+import argparse
+import time
+
+from libs.headless import use_dummy_drivers
+
+use_dummy_drivers()
+
+from game import Game  # noqa: E402 (the drivers must be chosen before pygame starts)
+from libs.replay import Replay, state_hash  # noqa: E402
+from libs.timestep import REFERENCE_RATE  # noqa: E402
+
+
+def play(path):
+    """Replay a recorded session as fast as possible, without rendering.
+
+    Returns:
+        tuple: True if the final state matches the recording, and the ticks per second.
+    """
+    replay = Replay(path)
+    game = Game(levels=replay.levels, seed=replay.seed)
+    dt = REFERENCE_RATE / replay.rate
+
+    start = time.perf_counter()
+    for inputs in replay.inputs:
+        game.update(dt, inputs)
+    duration = time.perf_counter() - start
+
+    return state_hash(game) == replay.state_hash, len(replay) / max(duration, 1e-9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded sessions and check they end in the same state.")
+    parser.add_argument("replays", nargs="+", help="replay files, recorded with game.py --record")
+    args = parser.parse_args()
+
+    ok = True
+    for path in args.replays:
+        matches, ticks_per_sec = play(path)
+        print(f"{path}  {'ok' if matches else 'MISMATCH'}  {ticks_per_sec:.0f} ticks/s")
+        ok = ok and matches
+
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import random
+
+from libs.tilemap import AUTOTILE_MAP, AUTOTILE_TILES, Tilemap
+
+
+def reference_autotile(tiles):
+    """The original autotiling, one tile and one set of neighbors at a time."""
+    for tile in tiles.values():
+        neighbors = set()
+        for shift in [(1, 0), (0, -1), (-1, 0), (0, 1)]:
+            check_location = f"{tile['pos'][0] + shift[0]};{tile['pos'][1] + shift[1]}"
+            if check_location in tiles:
+                if tiles[check_location]["type"] == tile["type"]:
+                    neighbors.add(shift)
+
+        neighbors = tuple(sorted(neighbors))
+        if tile["type"] in AUTOTILE_TILES and neighbors in AUTOTILE_MAP:
+            tile["variant"] = AUTOTILE_MAP[neighbors]
+
+
+def random_tiles(rng, cells=30, density=0.6):
+    tiles = {}
+    for x in range(-cells // 2, cells // 2):
+        for y in range(-cells // 2, cells // 2):
+            if rng.random() < density:
+                tiles[f"{x};{y}"] = {"type": rng.choice(["grass", "stone", "decor"]),
+                                     "variant": rng.randrange(9), "pos": [x, y]}
+
+    return tiles
+
+
+def variants(tilemap):
+    return {f"{tile['pos'][0]};{tile['pos'][1]}": tile["variant"] for tile in tilemap.tilemap}
+
+
+def copy_tiles(tiles):
+    return {location: dict(tile, pos=list(tile["pos"])) for location, tile in tiles.items()}
+
+
+def test_bulk_autotile_matches_the_reference():
+    rng = random.Random(10)
+    for _ in range(20):
+        tiles = random_tiles(rng)
+        tilemap = Tilemap(None)
+        tilemap.load_data({"tilemap": copy_tiles(tiles), "tile_size": 16, "offgrid": []})
+        tilemap.autotile()
+
+        reference_autotile(tiles)
+        assert variants(tilemap) == {location: tile["variant"] for location, tile in tiles.items()}
+
+
+def test_incremental_autotile_matches_the_reference():
+    rng = random.Random(11)
+    tiles = random_tiles(rng, cells=16)
+    tilemap = Tilemap(None)
+    tilemap.load_data({"tilemap": copy_tiles(tiles), "tile_size": 16, "offgrid": []})
+    tilemap.autotile()
+    reference_autotile(tiles)
+
+    for _ in range(300):
+        x, y = rng.randrange(-9, 9), rng.randrange(-9, 9)
+        if rng.random() < 0.3:
+            tilemap.remove_tile(x, y)
+            tiles.pop(f"{x};{y}", None)
+        else:
+            tile_type = rng.choice(["grass", "stone", "decor"])
+            tilemap.set_tile({"type": tile_type, "variant": 0, "pos": [x, y]})
+            tiles[f"{x};{y}"] = {"type": tile_type, "variant": 0, "pos": [x, y]}
+        tilemap.autotile_around(x, y)
+
+        reference_autotile(tiles)
+        assert variants(tilemap) == {location: tile["variant"] for location, tile in tiles.items()}
@@ -0,0 +1,59 @@
+import json
+
+from libs.chunks import CHUNK_AREA, CHUNK_SIZE, ChunkedTileStore, chunk_index, chunk_position
+
+
+def tile(x, y, tile_type="grass", variant=0):
+    return {"type": tile_type, "variant": variant, "pos": [x, y]}
+
+
+def test_negative_cells_map_to_negative_chunks():
+    assert chunk_position(-1, -1) == (-1, -1)
+    assert chunk_position(-CHUNK_SIZE, 0) == (-1, 0)
+    assert chunk_position(-CHUNK_SIZE - 1, CHUNK_SIZE) == (-2, 1)
+    assert chunk_index(-1, -1) == CHUNK_AREA - 1
+    assert chunk_index(-CHUNK_SIZE, -CHUNK_SIZE) == 0
+    assert chunk_index(-1, 0) == CHUNK_SIZE - 1
+
+
+def test_negative_cells_are_stored_separately():
+    store = ChunkedTileStore()
+    cells = [(x, y) for x in range(-CHUNK_SIZE - 2, 3) for y in (-CHUNK_SIZE - 1, -1, 0, 1)]
+    for x, y in cells:
+        store.set(x, y, tile(x, y))
+
+    assert len(store) == len(cells)
+    for x, y in cells:
+        assert store.get(x, y)["pos"] == [x, y]
+    assert store.get(3, 0) is None
+    assert store.get(-1, -2) is None
+    assert {tuple(found["pos"]) for found in store.query(-2, -1, 1, 0)} == {
+        (x, y) for x in range(-2, 2) for y in (-1, 0)}
+
+
+def test_removing_the_last_tile_drops_the_chunk():
+    store = ChunkedTileStore()
+    store.set(-1, -1, tile(-1, -1))
+    store.set(-2, -1, tile(-2, -1))
+
+    assert store.remove(-1, -1)["pos"] == [-1, -1]
+    assert store.remove(-1, -1) is None
+    assert (-1, -1) in store.chunks
+    store.remove(-2, -1)
+    assert (-1, -1) not in store.chunks
+    assert len(store) == 0
+
+
+def test_json_round_trip():
+    store = ChunkedTileStore()
+    for x, y, tile_type in [(-9, -1, "stone"), (-1, 0, "grass"), (0, -1, "grass"), (7, 8, "decor")]:
+        store.set(x, y, tile(x, y, tile_type, variant=x & 3))
+
+    exported = json.loads(json.dumps(store.to_json()))
+    assert set(exported) == {"-9;-1", "-1;0", "0;-1", "7;8"}
+
+    loaded = ChunkedTileStore()
+    loaded.load_json(exported)
+    assert len(loaded) == len(store)
+    assert loaded.to_json() == store.to_json()
+    assert loaded.get(-9, -1)["type"] == "stone"
@@ -0,0 +1,151 @@
+import math
+import random
+
+from libs.chunks import CHUNK_SHIFT
+from libs.tilemap import NEIGHBOR_OFFSETS, PHYSICS_TILES, Tilemap
+
+
+def random_tilemap(seed, cells=24, density=0.4):
+    rng = random.Random(seed)
+    tilemap = Tilemap(None)
+    for x in range(-cells // 2, cells // 2):
+        for y in range(-cells // 2, cells // 2):
+            if rng.random() < density:
+                tilemap.set_tile({"type": rng.choice(["grass", "stone", "decor"]), "variant": 0, "pos": [x, y]})
+
+    return tilemap
+
+
+def covered_cells(rect, tile_size):
+    return {(x, y) for x in range(rect.left // tile_size, rect.right // tile_size)
+            for y in range(rect.top // tile_size, rect.bottom // tile_size)}
+
+
+def test_a_block_is_merged_into_one_rect():
+    tilemap = Tilemap(None)
+    for x in range(1, 4):
+        for y in range(2, 4):
+            tilemap.set_tile({"type": "stone", "variant": 0, "pos": [x, y]})
+    tilemap.set_tile({"type": "decor", "variant": 0, "pos": [5, 2]})
+
+    chunk = tilemap.collision.chunk((0, 0))
+    assert [tuple(rect) for rect in chunk.rects] == [(16, 32, 48, 32)]
+    assert tilemap.collision.rect_at(2, 3) is chunk.rects[0]
+    assert tilemap.collision.rect_at(5, 2) is None
+
+
+def test_rects_cover_exactly_the_solid_cells():
+    for seed in range(10):
+        tilemap = random_tilemap(seed)
+        tile_size = tilemap.tile_size
+        solid = {tuple(tile["pos"]) for tile in tilemap.tilemap if tile["type"] in PHYSICS_TILES}
+
+        covered = set()
+        for position in tilemap.tilemap.chunks:
+            chunk = tilemap.collision.chunk(position)
+            for index, rect in enumerate(chunk.rects):
+                cells = covered_cells(rect, tile_size)
+                # Rectangles stay inside their chunk and never overlap
+                assert all((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT) == position for x, y in cells)
+                assert covered.isdisjoint(cells)
+                covered |= cells
+                for x, y in cells:
+                    assert tilemap.collision.rect_at(x, y) is chunk.rects[index]
+        assert covered == solid
+        for x, y in solid:
+            assert tilemap.collision.is_solid(x, y)
+
+
+def test_rects_around_lists_each_rect_once():
+    tilemap = random_tilemap(3, density=0.7)
+    tile_size = tilemap.tile_size
+    for x in range(-12, 12):
+        for y in range(-12, 12):
+            expected = {tuple(tilemap.collision.rect_at(x + dx, y + dy)) for dx, dy in NEIGHBOR_OFFSETS
+                        if tilemap.collision.rect_at(x + dx, y + dy) is not None}
+            found = tilemap.physics_rects_around([x * tile_size + 4, y * tile_size + 4])
+            assert len(found) == len(expected)
+            assert {tuple(rect) for rect in found} == expected
+
+
+def test_edits_rebuild_the_chunk():
+    tilemap = Tilemap(None)
+    tilemap.set_tile({"type": "stone", "variant": 0, "pos": [0, 0]})
+    tilemap.set_tile({"type": "stone", "variant": 0, "pos": [1, 0]})
+    assert [tuple(rect) for rect in tilemap.collision.chunk((0, 0)).rects] == [(0, 0, 32, 16)]
+
+    tilemap.remove_tile(1, 0)
+    assert [tuple(rect) for rect in tilemap.collision.chunk((0, 0)).rects] == [(0, 0, 16, 16)]
+    assert not tilemap.collision.is_solid(1, 0)
+
+
+def overlaps_solid(collision, x, y, width, height, tile_size=16):
+    return any(collision.is_solid(cell_x, cell_y)
+               for cell_x in range(math.floor(x / tile_size), math.ceil((x + width) / tile_size))
+               for cell_y in range(math.floor(y / tile_size), math.ceil((y + height) / tile_size)))
+
+
+def brute_sweep(collision, x, y, width, height, dx, dy, steps):
+    for step in range(1, steps + 1):
+        if overlaps_solid(collision, x + dx * step / steps, y + dy * step / steps, width, height):
+            return (step - 1) / steps
+
+    return 1.0
+
+
+def brute_move(collision, x, y, width, height, dx, dy, steps):
+    for _ in range(steps):
+        if dx and not overlaps_solid(collision, x + dx / steps, y, width, height):
+            x += dx / steps
+        else:
+            dx = 0
+        if dy and not overlaps_solid(collision, x, y + dy / steps, width, height):
+            y += dy / steps
+        else:
+            dy = 0
+
+    return x, y
+
+
+def sweep_cases(seed, count):
+    tilemap = random_tilemap(seed, cells=40, density=0.15)
+    rng = random.Random(seed)
+    cases = []
+    while len(cases) < count:
+        x, y = rng.uniform(-300, 300), rng.uniform(-300, 300)
+        if not overlaps_solid(tilemap.collision, x, y, 8, 15):
+            cases.append((x, y, rng.uniform(-80, 80), rng.uniform(-80, 80)))
+
+    return tilemap.collision, cases
+
+
+def test_sweep_matches_substepping():
+    steps = 1000
+    collision, cases = sweep_cases(1, 150)
+    for x, y, dx, dy in cases:
+        time, normal_x, normal_y = collision.sweep(x, y, 8, 15, dx, dy)
+        assert abs(time - brute_sweep(collision, x, y, 8, 15, dx, dy, steps)) <= 2 / steps
+        if time < 1:
+            assert (normal_x, normal_y) in [(-math.copysign(1, dx), 0), (0, -math.copysign(1, dy))]
+
+
+def test_move_matches_substepping():
+    steps = 1000
+    collision, cases = sweep_cases(2, 150)
+    for x, y, dx, dy in cases:
+        new_x, new_y, _, _ = collision.move(x, y, 8, 15, dx, dy)
+        expected_x, expected_y = brute_move(collision, x, y, 8, 15, dx, dy, steps)
+        assert not overlaps_solid(collision, new_x, new_y, 8, 15)
+        assert abs(new_x - expected_x) < 1 and abs(new_y - expected_y) < 1
+
+
+def test_fast_boxes_do_not_tunnel():
+    tilemap = Tilemap(None)
+    for x in range(-5, 40):
+        tilemap.set_tile({"type": "stone", "variant": 0, "pos": [x, 10]})
+    tilemap.set_tile({"type": "stone", "variant": 0, "pos": [20, 9]})
+    collision = tilemap.collision
+
+    assert collision.move(100, 0, 8, 15, 0, 500) == (100, 145, 0, -1)
+    assert collision.move(200, 145, 8, 15, 200, 0) == (312, 145, -1, 0)
+    assert collision.move(400, 145, 8, 15, -200, 0) == (336, 145, 1, 0)
@@ -0,0 +1,106 @@
+from libs.history import History
+from libs.tilemap import Tilemap
+
+
+def cells(tilemap):
+    return {tuple(tile["pos"]): (tile["type"], tile["variant"]) for tile in tilemap.tilemap}
+
+
+def offgrid(tilemap):
+    return sorted((tile["type"], tile["variant"], tuple(tile["pos"])) for tile in tilemap.offgrid_tiles.values())
+
+
+def test_undo_and_redo_cell_edits():
+    tilemap = Tilemap(None)
+    history = History(tilemap)
+    history.set_tile(0, 0, ("grass", 1))
+    history.set_tile(-1, 0, ("stone", 2))
+    history.end()
+    history.set_tile(0, 0, None)
+    history.set_tile(-1, 0, ("grass", 0))
+    history.end()
+    assert cells(tilemap) == {(-1, 0): ("grass", 0)}
+
+    assert history.undo()
+    assert cells(tilemap) == {(0, 0): ("grass", 1), (-1, 0): ("stone", 2)}
+    assert history.undo()
+    assert cells(tilemap) == {}
+    assert not history.undo()
+
+    assert history.redo()
+    assert history.redo()
+    assert cells(tilemap) == {(-1, 0): ("grass", 0)}
+    assert not history.redo()
+
+
+def test_edits_without_changes_are_not_recorded():
+    tilemap = Tilemap(None)
+    history = History(tilemap)
+    history.set_tile(3, 3, ("grass", 0))
+    history.set_tile(3, 3, None)
+    history.end()
+
+    assert not history.undo_entries
+    assert not history.undo()
+
+
+def test_a_new_edit_clears_the_redo_entries():
+    tilemap = Tilemap(None)
+    history = History(tilemap)
+    history.set_tile(0, 0, ("grass", 0))
+    history.end()
+    history.undo()
+    history.set_tile(1, 0, ("stone", 0))
+    history.end()
+
+    assert not history.redo()
+    assert cells(tilemap) == {(1, 0): ("stone", 0)}
+
+
+def test_undo_and_redo_offgrid_tiles_by_key():
+    tilemap = Tilemap(None)
+    history = History(tilemap)
+    first = {"type": "decor", "variant": 0, "pos": [4.0, 4.0]}
+    # Two equal tiles, only the one removed must come back
+    key = history.add_offgrid(dict(first))
+    history.add_offgrid(dict(first))
+    history.end()
+    history.remove_offgrid(key)
+    history.end()
+    assert offgrid(tilemap) == [("decor", 0, (4.0, 4.0))]
+
+    history.undo()
+    assert offgrid(tilemap) == [("decor", 0, (4.0, 4.0))] * 2
+    history.undo()
+    assert offgrid(tilemap) == []
+    history.redo()
+    history.redo()
+    assert offgrid(tilemap) == [("decor", 0, (4.0, 4.0))]
+    history.undo()
+    history.undo()
+    assert offgrid(tilemap) == []
+    assert not tilemap.offgrid_index.query_point((5, 5))
+
+
+def test_removing_a_tile_added_in_the_same_edit():
+    tilemap = Tilemap(None)
+    history = History(tilemap)
+    key = history.add_offgrid({"type": "decor", "variant": 0, "pos": [0.0, 0.0]})
+    history.remove_offgrid(key)
+    history.end()
+
+    assert not history.undo_entries
+    assert tilemap.offgrid_tiles == {}
+
+
+def test_oldest_entries_are_dropped():
+    tilemap = Tilemap(None)
+    history = History(tilemap, max_entries=3)
+    for x in range(5):
+        history.set_tile(x, 0, ("grass", 0))
+        history.end()
+
+    assert len(history.undo_entries) == 3
+    while history.undo():
+        pass
+    assert cells(tilemap) == {(0, 0): ("grass", 0), (1, 0): ("grass", 0)}
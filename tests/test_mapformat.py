@@ -0,0 +1,81 @@
+import os
+import stat
+
+from libs.mapformat import MapFile, chunks_from_json, encode_map, is_binary_map
+from libs.tilemap import Tilemap
+from libs.utils import UMASK, atomic_write
+
+TILES = {
+    "-9;-1": {"type": "stone", "variant": 3, "pos": [-9, -1]},
+    "-1;0": {"type": "grass", "variant": 1, "pos": [-1, 0]},
+    "0;0": {"type": "grass", "variant": 8, "pos": [0, 0]},
+    "17;4": {"type": "decor", "variant": 2, "pos": [17, 4]},
+}
+OFFGRID = [
+    {"type": "large_decor", "variant": 1, "pos": [-12.5, 40.0]},
+    {"type": "spawners", "variant": 0, "pos": [64.0, 8.0]},
+]
+
+
+def write_map(path, collision=None):
+    path.write_bytes(encode_map(chunks_from_json(TILES), 16, OFFGRID, collision))
+
+    return MapFile(str(path))
+
+
+def test_encode_decode_round_trip(tmp_path):
+    map_file = write_map(tmp_path / "level.map")
+    try:
+        assert is_binary_map(str(tmp_path / "level.map"))
+        assert map_file.tile_size == 16
+        assert map_file.offgrid_tiles == OFFGRID
+        assert map_file.collision == {}
+
+        decoded = {}
+        for position, count in map_file.counts.items():
+            chunk = map_file.read_chunk(position)
+            assert chunk.count == count
+            for tile in chunk.tiles:
+                if tile is not None:
+                    decoded[f"{tile['pos'][0]};{tile['pos'][1]}"] = tile
+        assert decoded == TILES
+    finally:
+        map_file.close()
+
+
+def test_collision_section_round_trip(tmp_path):
+    collision = [((-2, -1), 1 << 63 | 1, [(0, 0, 1, 1), (7, 7, 1, 1)]), ((0, 0), 0b11, [(0, 0, 2, 1)])]
+    map_file = write_map(tmp_path / "level.map", collision)
+    try:
+        assert map_file.collision == {position: (mask, rects) for position, mask, rects in collision}
+        assert map_file.offgrid_tiles == OFFGRID
+    finally:
+        map_file.close()
+
+
+def test_tilemap_save_load_round_trip(tmp_path):
+    tilemap = Tilemap(None)
+    tilemap.load_data({"tilemap": TILES, "tile_size": 16, "offgrid": OFFGRID})
+    tilemap.save(str(tmp_path / "level.map"))
+
+    loaded = Tilemap(None)
+    loaded.load(str(tmp_path / "level.map"))
+    # Chunks are only decoded when needed
+    assert not loaded.tilemap.chunks
+    assert len(loaded.tilemap) == len(TILES)
+    assert loaded.tilemap.get(-9, -1) == TILES["-9;-1"]
+    assert loaded.tilemap.to_json() == TILES
+    assert list(loaded.offgrid_tiles.values()) == OFFGRID
+    loaded.tilemap.clear()
+
+
+def test_atomic_write_keeps_the_file_mode(tmp_path):
+    path = tmp_path / "map.json"
+    atomic_write(str(path), "{}")
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o666 & ~UMASK
+
+    os.chmod(path, 0o640)
+    atomic_write(str(path), b"[]")
+    assert path.read_bytes() == b"[]"
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o640
+    assert os.listdir(tmp_path) == ["map.json"]